@@ -0,0 +1,12 @@
+from settings import SHAPEFILE
+from settings import MAP_SIZE
+from settings import MAP_REGION
+from trafficSimulator.config import MAP_CACHE_FOLDER
+from trafficSimulator.realMap import RealMap
+
+
+if __name__ == '__main__':
+    # Create the map from the shapefile and write it to a compiled map file.
+    # The next RealMap with the same shapefile, MAP_SIZE and RANDOM_SEED will load this file.
+    realMap = RealMap(SHAPEFILE, MAP_SIZE, MAP_REGION)
+    print "Compiled map:", realMap.compileMap(MAP_CACHE_FOLDER)
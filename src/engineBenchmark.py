@@ -0,0 +1,70 @@
+import sys
+import time
+import multiprocessing
+import numpy as np
+from settings import SHAPEFILE
+from settings import MAP_SIZE
+from settings import MAP_REGION
+from trafficSimulator.realMap import RealMap
+from trafficSimulator.trafficUtil import Traffic
+from trafficSimulator.trafficUtil import CarType
+from trafficSimulator.vectorizedEngine import VectorizedEngine
+
+DELTA_TIME = 0.3  # second
+
+
+def deleteCars(cars):
+    for car in cars.values():
+        if car.delete:
+            car.release()
+            del cars[car.id]
+
+
+def runMode(realMap, mode, vehicleNum, ticks, results):
+    """
+    Run the simulation with one engine mode and put the result into the results queue.
+    :param mode: "scalar", "vectorized" or "compare"
+    """
+    realMap.addRandomCars(vehicleNum, CarType.CAR, False)
+    cars = realMap.cars
+    engine = VectorizedEngine()
+    maxDiff = [0.0, 0.0, 0.0]
+    start_time = time.time()
+    for tick in xrange(ticks):
+        Traffic.increaseGlobalTime(DELTA_TIME)
+        deleteCars(cars)
+        if mode == "scalar":
+            for car in cars.values():
+                car.move(DELTA_TIME)
+        elif mode == "vectorized":
+            engine.move(cars.values(), DELTA_TIME)
+        else:
+            # compute both steps on the same state, then move with the vectorized ones
+            moving = engine.prepare(cars.values())
+            vectorized = engine.computeSteps(moving, DELTA_TIME)
+            scalar = engine.scalarSteps(moving, DELTA_TIME)
+            for i in xrange(3):
+                relativeDiff = abs(vectorized[i] - scalar[i]) / np.maximum(abs(scalar[i]), 1)
+                maxDiff[i] = max(maxDiff[i], relativeDiff.max())
+            engine.apply(moving, vectorized[1], vectorized[2])
+        realMap.updateContralSignal(DELTA_TIME)
+    results.put((mode, ticks / (time.time() - start_time), len(cars), maxDiff))
+
+
+if __name__ == '__main__':
+    # Compare the scalar and vectorized engines: python engineBenchmark.py [number of vehicles] [ticks]
+    vehicleNum = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    realMap = RealMap(SHAPEFILE, MAP_SIZE, MAP_REGION)
+    results = multiprocessing.Queue()
+    # every mode runs in a forked process, so all of them start from the same map and random state
+    for mode in ("scalar", "vectorized", "compare"):
+        process = multiprocessing.Process(target=runMode, args=(realMap, mode, vehicleNum, ticks, results))
+        process.start()
+        mode, ticksPerSecond, carNum, maxDiff = results.get()
+        process.join()
+        if mode == "compare":
+            print "Max relative difference from the scalar engine: acceleration %g, speed %g, step %g" % tuple(maxDiff)
+        else:
+            print "%s engine: %.2f ticks/sec (%d vehicles left)" % (mode, ticksPerSecond, carNum)
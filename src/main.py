@@ -6,6 +6,7 @@ from settings import SHAPEFILE
 from settings import TAXI_NUM
 from settings import CAR_NUM
 from settings import MAP_SIZE
+from settings import MAP_REGION
 from settings import CRASH_RELATIVE_POSITION
 from settings import CRASH_ROAD
 from settings import MAJOR_ROAD_INIT_CAR_NUM_RATIO
@@ -32,7 +33,7 @@ if __name__ == '__main__':
     printParam()
 
     # Create a RealMap object and pass it to a Environment object.
-    realMap = RealMap(SHAPEFILE, MAP_SIZE)
+    realMap = RealMap(SHAPEFILE, MAP_SIZE, MAP_REGION)
     env = Environment(realMap)
     carNum = CAR_NUM
 
@@ -0,0 +1,90 @@
+import sys
+import time
+import resource
+from settings import SHAPEFILE
+from settings import MAP_SIZE
+from settings import MAP_REGION
+from trafficSimulator.realMap import RealMap
+from trafficSimulator.car import Car
+from trafficSimulator.trafficUtil import Traffic
+from trafficSimulator.config import DRIVE_TIME_HISTORY_SIZE
+
+
+def objectSize(obj):
+    """
+    :return: the size (bytes) of the object and its attribute dictionary (if it has one)
+    """
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def vehicleSize(car):
+    """
+    :return: the size (bytes) of the objects that belong to one vehicle
+    """
+    trajectory = car.trajectory
+    objs = [car, car.engine, trajectory, trajectory.current, trajectory.next, car.id, trajectory.current.id,
+            trajectory.next.id, trajectory.getRoad().roadSpeed.cars[car.id]]
+    return sum(objectSize(obj) for obj in objs)
+
+
+def maxRss():
+    """
+    :return: the peak resident memory (MB) of this process
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+if __name__ == '__main__':
+    # Measure the memory of the vehicles: python memoryBenchmark.py [number of vehicles] [ticks]
+    vehicleNum = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+
+    realMap = RealMap(SHAPEFILE, MAP_SIZE, MAP_REGION)
+    rssBefore = maxRss()
+    start_time = time.time()
+    cars = {}
+    for i in xrange(vehicleNum):
+        lane, position = realMap.randomLaneLocation()
+        car = Car(realMap.navigator, lane, position)
+        car.destination = realMap.getRandomDestination()
+        cars[car.id] = car
+    print "Created %d vehicles using %f seconds" % (vehicleNum, time.time() - start_time)
+
+    # the lookups that happen on every tick
+    start_time = time.time()
+    for car in cars.itervalues():
+        lanePos = car.trajectory.current
+        lanePos.lane.carsPosition[lanePos.id]
+        car.trajectory.getRoad().roadSpeed.cars[car.id]
+        cars[car.id]
+    print "Looked up every vehicle in its lane, road and the vehicle table using %f seconds" % \
+          (time.time() - start_time)
+
+    # move the cars so that the roads collect drive time records
+    start_time = time.time()
+    for tick in xrange(ticks):
+        Traffic.increaseGlobalTime(0.3)
+        for car in cars.values():
+            car.move(0.3)
+        for car in cars.values():
+            if car.delete:
+                car.release()
+                del cars[car.id]
+        realMap.updateContralSignal(0.3)
+    if ticks:
+        print "Moved the vehicles for %d ticks using %f seconds" % (ticks, time.time() - start_time)
+
+    sizes = [vehicleSize(car) for car in cars.itervalues()]
+    print "Objects of a vehicle: %.1f bytes" % (sum(sizes) / float(len(sizes)))
+    store = realMap.vehicleStore
+    storeBytes = sum(arr.nbytes for arr in vars(store).values() if hasattr(arr, "nbytes"))
+    print "Vehicle store: %.1f bytes per row (%d rows)" % (storeBytes / float(store.capacity), store.capacity)
+    roadSpeeds = [road.roadSpeed for road in realMap.roads.itervalues()]
+    print "Drive time records: %.1f bytes per road (at most %d finished records per road, %d dropped)" % \
+          (sum(rs.memorySize() for rs in roadSpeeds) / float(len(roadSpeeds)), DRIVE_TIME_HISTORY_SIZE,
+           sum(rs.droppedNum for rs in roadSpeeds))
+    print "Peak memory: %.1f MB (%.1f bytes per vehicle)" % \
+          (maxRss(), (maxRss() - rssBefore) * 1024 * 1024 / vehicleNum)
@@ -0,0 +1,142 @@
+import sys
+import time
+import random
+from settings import SHAPEFILE
+from settings import MAP_SIZE
+from settings import MAP_REGION
+from trafficSimulator.realMap import RealMap
+from trafficSimulator.car import Car
+from trafficSimulator.navigation import Navigator
+from trafficSimulator.routeCache import RouteCache
+from trafficSimulator.trafficUtil import Traffic
+from trafficSimulator.config import TRAVEL_TIME_EPOCH_TOLERANCE
+
+DELTA_TIME = 0.3        # second
+SOURCE_LAMBDA = 0.05    # the average number of cars added at each source per tick
+
+
+def makeQueries(realMap, queryNum):
+    """
+    :return: a list of (car, source road, destination) from random locations to random sinks
+    """
+    queries = []
+    for i in xrange(queryNum):
+        lane, position = realMap.randomLaneLocation()
+        car = Car(realMap.navigator, lane, position)
+        queries.append((car, lane.road, realMap.getRandomDestination()))
+    return queries
+
+
+def routeTime(realMap, route):
+    times = realMap.travelTimes.getTimes()
+    return sum(times[road.edgeIdx] for road in route or [])
+
+
+def runQueries(realMap, queries, navigate):
+    """
+    :param navigate: a function (car, source, destination) -> route
+    :return: (a list of the latencies (second), a list of the routes' times, the total number of settled intersections)
+    """
+    latencies = []
+    routeTimes = []
+    settledNum = 0
+    for car, source, destination in queries:
+        start_time = time.time()
+        route = navigate(car, source, destination)
+        latencies.append(time.time() - start_time)
+        routeTimes.append(routeTime(realMap, route))
+        settledNum += realMap.navigator.settledNum
+    return latencies, routeTimes, settledNum
+
+
+def runTraffic(realMap, ticks):
+    """
+    Add cars at the sources and move them for the given ticks, so the cars are routed while the
+    travel times change.
+    """
+    cars = realMap.cars
+    for tick in xrange(ticks):
+        Traffic.increaseGlobalTime(DELTA_TIME)
+        realMap.addCarFromSource(SOURCE_LAMBDA)
+        for car in cars.values():
+            car.move(DELTA_TIME)
+        for car in cars.values():
+            if car.delete:
+                car.release()
+                del cars[car.id]
+        realMap.updateContralSignal(DELTA_TIME)
+
+
+def report(name, latencies, settledNum):
+    latencies = sorted(latencies)
+    print "%s: mean %.3f ms, median %.3f ms, 95%% %.3f ms per query, %.1f intersections settled per query" % \
+          (name, 1000 * sum(latencies) / len(latencies), 1000 * latencies[len(latencies) // 2],
+           1000 * latencies[int(len(latencies) * 0.95)], settledNum / float(len(latencies)))
+
+
+if __name__ == '__main__':
+    # Measure the latency of the route queries: python routingBenchmark.py [number of queries] [ticks]
+    queryNum = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+
+    realMap = RealMap(SHAPEFILE, MAP_SIZE, MAP_REGION)
+    queries = makeQueries(realMap, queryNum)
+    navigator = realMap.navigator
+    navigator.routeCache = RouteCache(0)  # every search algorithm answers every query
+    latencies, routeTimes, settledNum = runQueries(realMap, queries, navigator.navigate)
+    report("Dijkstra", latencies, settledNum)
+
+    def astar(car, source, destination):
+        return navigator.navigate(car, source, destination, Navigator.ASTAR)
+    latencies, astarTimes, settledNum = runQueries(realMap, queries, astar)
+    report("A*", latencies, settledNum)
+    print "A* routes: max time difference from Dijkstra %g seconds" % \
+          max(abs(a - b) for a, b in zip(astarTimes, routeTimes))
+
+    def alt(car, source, destination):
+        return navigator.navigate(car, source, destination, Navigator.ALT)
+    start_time = time.time()
+    alt(*queries[0])  # computes the landmarks
+    print "ALT preprocessing: %.3f seconds for %d landmarks" % \
+          (time.time() - start_time, len(navigator.landmarks.landmarks))
+    latencies, altTimes, settledNum = runQueries(realMap, queries, alt)
+    report("ALT", latencies, settledNum)
+    print "ALT routes: max time difference from Dijkstra %g seconds" % \
+          max(abs(a - b) for a, b in zip(altTimes, routeTimes))
+
+    def cch(car, source, destination):
+        return navigator.navigate(car, source, destination, Navigator.CCH)
+    start_time = time.time()
+    cch(*queries[0])  # builds and customizes the hierarchy
+    hierarchy = navigator.hierarchy
+    print "CCH preprocessing and first customization: %.3f seconds, %d arcs for %d roads" % \
+          (time.time() - start_time, hierarchy.arcNum(), realMap.graph.edgeNum())
+    start_time = time.time()
+    hierarchy.customize(realMap.travelTimes)
+    print "CCH customization: %.3f seconds" % (time.time() - start_time)
+    latencies, cchTimes, settledNum = runQueries(realMap, queries, cch)
+    report("CCH", latencies, settledNum)
+    print "CCH routes: max time difference from Dijkstra %g seconds" % \
+          max(abs(a - b) for a, b in zip(cchTimes, routeTimes))
+
+    # the queries again in a random order, with every query asked by several cars at its source
+    navigator.routeCache = RouteCache()
+    repeated = [query for query in queries for i in xrange(4)]
+    random.shuffle(repeated)
+    latencies, cachedTimes, settledNum = runQueries(realMap, repeated, navigator.navigate)
+    report("Dijkstra with the route cache", latencies, settledNum)
+    cache = navigator.routeCache
+    print "Route cache: %d hits, %d misses, %d evictions, %d routes with %d roads kept" % \
+          (cache.hits, cache.misses, cache.evictions, len(cache), cache.roadNum)
+
+    # the cars added at the sources while the clock runs, so the travel time epoch advances
+    navigator.routeCache = cache = RouteCache()
+    travelTimes = realMap.travelTimes
+    epoch, version = travelTimes.getEpoch(), travelTimes.version
+    start_time = time.time()
+    runTraffic(realMap, ticks)
+    print "Route cache in %d ticks of traffic: %d hits, %d misses (%.1f%% hit rate), %d epochs in %d snapshots " \
+          "(tolerance %g), %.3f seconds" % \
+          (ticks, cache.hits, cache.misses, 100.0 * cache.hits / max(cache.hits + cache.misses, 1),
+           travelTimes.epoch - epoch, travelTimes.version - version, TRAVEL_TIME_EPOCH_TOLERANCE,
+           time.time() - start_time)
@@ -16,6 +16,12 @@ CAR_NUM = 500
 MAP_SIZE = 8000
 """Map size, the number of shape file record to be read"""
 
+MAP_REGION = None
+"""
+The region of the map to be read: a bounding box (top, bot, right, left) or a list of (lng, lat)
+points of a polygon. None: read the first MAP_SIZE records.
+"""
+
 CALL_NEW_TAXI_TIME_GAP = 2
 """
 The threshold of time (minute) for the system to call a new taxi that
@@ -7,10 +7,13 @@ from settings import TIME_FOR_ACCIDENT
 from trafficSimulator.config import METER_TYPE
 from trafficSimulator.config import POI_LAMBDA
 from trafficSimulator.config import MAJOR_ROAD_POI_LAMBDA
+from trafficSimulator.config import VECTORIZED_ENGINE
 from trafficSimulator.drawUtil import DistanceUnit
 from trafficSimulator.trafficUtil import Traffic
 from trafficSimulator.trafficUtil import PriorityItemQueue
+from trafficSimulator.trafficUtil import CarType
 from trafficSimulator.sinkSource import SinkSource
+from trafficSimulator.vectorizedEngine import VectorizedEngine
 
 
 class TrafficController(object):
@@ -44,6 +47,7 @@ class TrafficController(object):
         self.calledTaxi = []
         self.arrivedTaxiNum = 0
         self.isCalledTaxiArrived = False
+        self.vectorizedEngine = VectorizedEngine() if VECTORIZED_ENGINE else None
 
     def initRandomCar(self, carNum, taxiNum, majorRoadCarInitRatio):
         """
@@ -112,21 +116,31 @@ class TrafficController(object):
             self.deleteCar()
 
             # make each car move
-            for car in self.cars.values():
-                car.move(deltaTime)
+            self.moveCars(self.cars.values(), deltaTime)
 
             # assign a new destination to taxis that arrive their old destinations.
             self.assignDestinationToTaxis()
 
             # make each taxi move
-            for taxi in self.taxis.values():
-                taxi.move(deltaTime)
+            self.moveCars(self.taxis.values(), deltaTime)
 
             # make traffic light change
             self.env.updateContralSignal(deltaTime)
 
             # time.sleep(0.2)
 
+    def moveCars(self, cars, deltaTime):
+        """
+        Make the given cars move, all at once if the vectorized engine is enabled.
+        :param cars: a list of cars or taxis
+        :param deltaTime: the time interval in second
+        """
+        if self.vectorizedEngine:
+            self.vectorizedEngine.move(cars, deltaTime)
+        else:
+            for car in cars:
+                car.move(deltaTime)
+
     def callTaxiForCrash(self, crashedCar):
         """
         Call the nearest taxi for the crash event. In addition, also call other taxis for the same crash event.
@@ -156,7 +170,7 @@ class TrafficController(object):
         """
         crashRoad = crashedCar.trajectory.getRoad()
         crashRoad.speedLimit = SPEED_LIMIT_ON_CRASH
-        print "%s crashed on %s at time %d" % (crashedCar.id, crashRoad.id, Traffic.globalTime)
+        print "%s crashed on %s at time %d" % (crashedCar.name, crashRoad.id, Traffic.globalTime)
         print "Set the speed limit of %s to %d %s" % (crashRoad.id,
                                                       crashRoad.speedLimit,
                                                       "km/h" if METER_TYPE == DistanceUnit.KM else "mph")
@@ -188,13 +202,13 @@ class TrafficController(object):
                         self.isCalledTaxiArrived = True
                         print "=====>",
                     print "%s arrived the crash location at time %d (total %d taxis arrived)\n" % \
-                                                 (taxi.id, Traffic.globalTime, self.arrivedTaxiNum)
+                                                 (taxi.name, Traffic.globalTime, self.arrivedTaxiNum)
                 else:
                     if taxi.called:
-                        print "\n\n%s arrived the crash location!!\n\n" % taxi.id9
+                        print "\n\n%s arrived the crash location!!\n\n" % taxi.name
                         taxi.alive = False
                     else:
-                        print "%s arrived its destination. Assign a new destination to it." % taxi.id
+                        print "%s arrived its destination. Assign a new destination to it." % taxi.name
                         newDestination = self.env.getRandomDestination()
                         taxi.destination = newDestination
                         taxi.delete = False
@@ -212,10 +226,10 @@ class TrafficController(object):
         :return: True if successfully called the taxi; otherwise return False.
         """
         if taxi.calledByDestination(dest):
-            print "Called taxi %s for the crash" % taxi.id
+            print "Called taxi %s for the crash" % taxi.name
             return True
         else:
-            print "Failed to call %s" % taxi.id
+            print "Failed to call %s" % taxi.name
             return False
 
     def findNearestTaxi(self, loc):
@@ -249,8 +263,8 @@ class TrafficController(object):
         :return: the nearest taxi.
         """
         fastTaxi = [sys.maxint, None]
-        for car in loc.road.getCars():
-            if car.isTaxi and car.available:
+        for car in loc.road.getCars(CarType.TAXI):
+            if car.available:
                 if car.trajectory.current.position <= loc.position:
                     if not fastTaxi[1] or loc.position - car.trajectory.current.position < fastTaxi[0]:
                         fastTaxi[0] = loc.position - car.trajectory.current.position
@@ -266,27 +280,23 @@ class TrafficController(object):
         :return: the nearest taxi.
         """
         fastTaxi = [sys.maxint, None]
-        roadTrafficTime = {}
+        roadTrafficTime = self.env.realMap.travelTimes.getTimes()
         frontier = PriorityItemQueue()
         frontier.push(0, loc.road.getSource())
 
         while frontier.size() > 0 and frontier.peek().priority < fastTaxi[0]:
             curr = frontier.pop()
             for road in curr.item.getInRoads():
-                if road in roadTrafficTime:
-                    trafficTime = roadTrafficTime[road]
-                else:
-                    trafficTime = road.getAvgTrafficTime()
-                    roadTrafficTime[road] = trafficTime
+                trafficTime = roadTrafficTime[road.edgeIdx]
 
-                for car in road.getCars():
-                    if car.isTaxi and car.available:
+                for car in road.getCars(CarType.TAXI):
+                    if car.available:
                         time = curr.priority + (1 - car.trajectory.current.position) * trafficTime
                         if time < fastTaxi[0]:
-                            print "found faster %s that can arrive the crash location in %f seconds" % (car.id, time)
+                            print "found faster %s that can arrive the crash location in %f seconds" % (car.name, time)
                             fastTaxi = (time, car)
                         else:
-                            print "     %s is slower (%f second)" % (car.id, time)
+                            print "     %s is slower (%f second)" % (car.name, time)
 
                 # update time to intersection if the time is quicker
                 # if the time is less than the previous calculated time, replace it
@@ -6,6 +6,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import math
 from trafficUtil import Traffic
 from trafficUtil import sampleOne
+from trafficUtil import CarType
 
 from trajectory import Trajectory
 from config import CAR_LENGTH
@@ -14,12 +15,26 @@ from config import UPDATE_ROUTE_TIME
 from config import MAX_SPEED
 from src.settings import UPDATE_NAVIGATION
 from engine import Engine
+from vehicleStore import VehicleStore
+from vehicleStore import rowProperty
 
 class Car(object):
     """
     A class that represents a car.
     """
 
+    __slots__ = ("id", "carType", "called", "width", "trajectory", "engine", "destination", "route", "routeSetTime",
+                 "navigator", "store", "row")
+
+    vehicleType = CarType.CAR  # the key of this car in the member sets of the lanes and roads
+
+    # the state in the VehicleStore
+    isTaxi = rowProperty("isTaxi")
+    alive = rowProperty("alive")
+    delete = rowProperty("delete")
+    crashed = rowProperty("crashed")
+    length = rowProperty("length")
+
     def __init__(self, navigator, lane, position=0, maxSpeed=MAX_SPEED, carType="Car"):
         """
         :param lane: the lane that this car is moving on
@@ -30,7 +45,10 @@ class Car(object):
         # ====================================================================
         # basic information and states for this car
         # ====================================================================
-        self.id = Traffic.uniqueId(carType)                 # the id for this car
+        self.store = navigator.realMap.vehicleStore         # VehicleStore for the state of this car
+        self.row = self.store.allocate()                    # the row of this car in the store
+        self.id = Traffic.uniqueNumber("Vehicle")           # the (int) id for this car; shared by cars and taxis
+        self.carType = carType                              # "Car" or "Taxi", for the name of this car
         self.isTaxi = False                                 # indicate this car is a general car or a taxi
         self.called = False                                 # is called for the crashed car
         self.alive = True                                   # when this car is going to reach the sink place
@@ -63,6 +81,22 @@ class Car(object):
     def __hash__(self):
         return hash(self.id)
 
+    @property
+    def nextLane(self):
+        """the next lane this can is going to"""
+        return self.store.getLane(self.store.nextLaneIdx.item(VehicleStore.checkRow(self.row)))
+
+    @nextLane.setter
+    def nextLane(self, lane):
+        self.store.nextLaneIdx[VehicleStore.checkRow(self.row)] = self.store.laneIndex(lane)
+
+    @property
+    def name(self):
+        """
+        :return: the string form of the id for display, e.g. "Car_12"
+        """
+        return "%s_%d" % (self.carType, self.id)
+
     def setDestination(self, destination):
         """
         Set the destination for this car.
@@ -105,7 +139,7 @@ class Car(object):
         """
         self.crashed = boolean
         if self.crashed:
-            self.engine.speed = 0
+            self.engine.setSpeed(0)
 
     def setSpeed(self, speed):
         self.engine.setSpeed(speed)
@@ -119,9 +153,18 @@ class Car(object):
 
     def release(self):
         """
-        delete this car's position from the lane
+        delete this car's position from the lane and give its row in the VehicleStore back
         """
         self.trajectory.release()
+        if self.row is not None:
+            self.store.release(self.row)
+            # the row goes to the next vehicle, so the proxies of this car raise (VehicleStore.checkRow)
+            # instead of changing its state
+            self.row = None
+            self.engine.row = None
+            for lanePos in (self.trajectory.current, self.trajectory.next):
+                if lanePos:
+                    lanePos.row = None
 
     def move(self, second):
         """
@@ -136,9 +179,22 @@ class Car(object):
         if self.crashed:
             return
 
+        self.prepareMove()
+        step = self.calcMovingDist(second)
+        self.finishMove(step)
+
+    def prepareMove(self):
+        """
+        Update the route and change to the preferred lane before the distance of the move is computed.
+        """
         self.updateNavigation()
         self.switchToQuickerLane()
-        step = self.calcMovingDist(second)
+
+    def finishMove(self, step):
+        """
+        Turn at the intersection if needed and move forward by the given distance.
+        :param step: the distance (km) of this move
+        """
         self.makeTurn(step)
         self.setAliveAndDeleteFlags()
         self.trajectory.moveForward(step)
@@ -236,7 +292,7 @@ class Car(object):
         if not possibleRoads:
             possibleRoads = [road for road in intersection.getOutRoads()]
             if not possibleRoads:
-                print "[%s]: There is no random road" % self.id
+                print "[%s]: There is no random road" % self.name
                 return None
         nextRoad = sampleOne(possibleRoads)
         return nextRoad
@@ -254,7 +310,7 @@ class Car(object):
             return None
         self.nextLane = self.getLaneNumber(nextRoad)
         if not self.nextLane:
-            print "[%s]: cannot pick next lane" % self.id
+            print "[%s]: cannot pick next lane" % self.name
 
     def getLaneNumber(self, nextRoad):
         """
@@ -281,6 +337,10 @@ class Taxi(Car):
     A class that represents a taxi.
     """
 
+    __slots__ = ("available", "destRoad", "destLane", "destPosition")
+
+    vehicleType = CarType.TAXI
+
     def __init__(self, navigator, lane, position, maxSpeed=MAX_SPEED, carType="Taxi"):
         super(Taxi, self).__init__(navigator, lane, position, maxSpeed, carType)
         self.available = True
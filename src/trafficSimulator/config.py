@@ -75,6 +75,9 @@ MAJOR_ROAD_POI_LAMBDA = POI_LAMBDA * 3
 AVG_TIME_PERIOD = 300
 """Time period (in second) for calculating average drive time of a road"""
 
+DRIVE_TIME_HISTORY_SIZE = 256
+"""The maximum number of finished drive times kept by a road for its average; the oldest ones are dropped first"""
+
 PERCENTAGE_FOR_AVG_DRIVE_TIME = 0.4
 """The percentage of"""
 
@@ -87,6 +90,52 @@ SINK_SOURCE_PROB = 0.2
 MIN_SINK_SOURCE_ROAD_LENGTH = 0.2
 ROAD_OFFSET_FOR_SINK_SOURCE_POINT = 0.1
 
+USE_SPATIAL_INDEX = True
+"""Use a uniform grid to find the roads connected to each intersection when creating the map"""
+
+SPATIAL_GRID_CELL_SIZE = None
+"""The cell size (in GPS degree) of the grid. None: use the average size of the roads"""
+
+MAP_BUILD_PROCESSES = 1
+"""The number of processes for creating the map tile by tile. 1: create the map in this process"""
+
+MAP_BUILD_TILES = None
+"""The number of tiles for creating the map with multiple processes. None: 4 tiles for each process"""
+
+PRUNE_UNREACHABLE_FRAGMENTS = True
+"""Only add cars and pick destinations in the largest strongly connected component of the map"""
+
+USE_MAP_CACHE = True
+"""Load the compiled map file if it exists; otherwise create the map and compile it"""
+
+MAP_CACHE_FOLDER = "./mapCache"
+"""The folder for the compiled map files"""
+
+MAP_CACHE_CHECK_CONTENT = False
+"""Also check the SHA-1 hash of the shapefile's content before loading a compiled map, not only its size and modification time"""
+
+VECTORIZED_ENGINE = False
+"""Compute the moves of all cars at once with NumPy (VectorizedEngine) instead of car by car"""
+
+TRAVEL_TIME_SNAPSHOT_INTERVAL = 0
+"""Time (in second) between two snapshots of the roads' traffic times for routing and taxi dispatch. 0: every tick"""
+
+TRAVEL_TIME_EPOCH_TOLERANCE = 0.05
+"""The change of the roads' traffic times, relative to their sum, that starts a new travel time epoch (and outdates the cached routes)"""
+
+ROUTING_ALGORITHM = "dijkstra"
+"""The default route search of the navigator: "dijkstra", "astar", "alt" (A* and ALT find routes of the same time)
+or "cch" (customizable contraction hierarchy)"""
+
+ALT_LANDMARK_NUM = 8
+"""The number of landmarks for ALT routing. Each one keeps two free-flow times per intersection"""
+
+CCH_CUSTOMIZE_INTERVAL = 30
+"""Time (in second) between two customizations of the contraction hierarchy with the roads' traffic times. 0: with every snapshot"""
+
+ROUTE_CACHE_SIZE = 100000
+"""The maximum total number of roads in the routes kept by the navigator's route cache. 0: no cache"""
+
 # ============================================================================
 # Animation MAP Configuration
 # ============================================================================
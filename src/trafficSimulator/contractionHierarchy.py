@@ -0,0 +1,296 @@
+import numpy as np
+from trafficUtil import Traffic
+from config import CCH_CUSTOMIZE_INTERVAL
+
+
+class ContractionHierarchy(object):
+    """
+    A customizable contraction hierarchy (CCH) of the RoadGraph. The preprocessing only uses the
+    topology: the intersections are ordered by nested dissection of their coordinates, and every
+    intersection is contracted in that order by connecting all its higher neighbors, which gives an
+    undirected graph of arcs from each intersection to its higher neighbors. The customization puts
+    the current traffic times on the arcs, bottom-up over the lower triangles of the arcs, so it can
+    be done again whenever the times change. A query only relaxes the upward arcs of the ancestors of
+    the source and the target in the elimination tree, and the arcs on the route are unpacked into roads.
+    """
+
+    LEAF_SIZE = 8  # the nested dissection stops at this number of intersections
+
+    def __init__(self, graph, customizeInterval=CCH_CUSTOMIZE_INTERVAL):
+        """
+        :param graph: RoadGraph
+        :param customizeInterval: (second) the minimum global time between two customizations;
+                                  0: customize with every new travel time snapshot
+        """
+        self.graph = graph
+        self.customizeInterval = customizeInterval
+        self.customizeTime = None     # the global time of the last customization
+        self.snapshotVersion = None   # the version of the travel time snapshot of the last customization
+        self.customizeNum = 0         # the number of customizations so far
+
+        n = graph.nodeNum()
+        neighbors = [set() for _ in xrange(n)]  # node id -> the set of the node ids connected to it by a road
+        for s, t in zip(graph.edgeSource.tolist(), graph.edgeTarget.tolist()):
+            if s != t:
+                neighbors[s].add(t)
+                neighbors[t].add(s)
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.computeOrder(neighbors)] = np.arange(n)
+        self.contract(neighbors)
+
+        self.upTimes = None    # arc id -> the time from the lower to the higher intersection
+        self.downTimes = None  # arc id -> the time from the higher to the lower intersection
+        self.upVia = None      # arc id -> the triangle of the up time; -1: a road
+        self.downVia = None    # arc id -> the triangle of the down time; -1: a road
+        self.upEdge = None     # arc id -> the edge id of the road of the up time
+        self.downEdge = None   # arc id -> the edge id of the road of the down time
+        self.upTimeList = []   # the times and their triangles and roads as lists, for the queries
+        self.downTimeList = []
+        self.upViaList = []
+        self.downViaList = []
+        self.upEdgeList = []
+        self.downEdgeList = []
+        self.triangleArcList = self.triangleArcs.tolist()
+        self.settledNum = 0    # the number of intersections reached by the last query
+
+    def computeOrder(self, neighbors):
+        """
+        Nested dissection: split the intersections in two halves at the median coordinate of the longer
+        side of their bounding box, take the intersections of one half that have a neighbor in the other
+        half as the separator, and order the two halves recursively before the separator.
+        :param neighbors: a list of the neighbor sets of the nodes
+        :return: a NumPy array of the node ids from the lowest to the highest rank
+        """
+        graph = self.graph
+        coords = np.array([inter.center.getCoords() for inter in graph.nodes], dtype=float).reshape((-1, 2))
+
+        order = []
+        stack = [(np.arange(graph.nodeNum()), False)]
+        while stack:
+            nodes, isSeparator = stack.pop()
+            if isSeparator or len(nodes) <= ContractionHierarchy.LEAF_SIZE:
+                order.extend(nodes.tolist())
+                continue
+            points = coords[nodes]
+            axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+            sortedNodes = nodes[np.argsort(points[:, axis], kind="mergesort")]
+            half = len(sortedNodes) // 2
+            first = sortedNodes[:half]
+            second = set(sortedNodes[half:].tolist())
+            isBoundary = np.array([not neighbors[node].isdisjoint(second) for node in first.tolist()], dtype=bool)
+            # the stack is last in first out, so the separator is ordered after both halves
+            stack.append((first[isBoundary], True))
+            stack.append((sortedNodes[half:], False))
+            stack.append((first[~isBoundary], False))
+        return np.array(order, dtype=np.int64)
+
+    def contract(self, neighbors):
+        """
+        Contract the intersections by their ranks, and number the arcs and their lower triangles.
+        :param neighbors: a list of the neighbor sets of the nodes; the shortcuts are added to them
+        """
+        rank = self.rank.tolist()
+        n = len(rank)
+        order = sorted(xrange(n), key=lambda node: rank[node])
+        upper = [None] * n
+        for node in order:
+            higher = sorted([nb for nb in neighbors[node] if rank[nb] > rank[node]], key=lambda nb: rank[nb])
+            upper[node] = higher
+            for nb in higher:
+                neighbors[nb].update(higher)
+                neighbors[nb].discard(nb)
+
+        # the arcs of each intersection to its higher neighbors in CSR, by the rank of the neighbors
+        self.arcOffsets = np.zeros(n + 1, dtype=np.int64)
+        self.arcOffsets[1:] = np.cumsum([len(higher) for higher in upper])
+        self.arcHead = np.array([nb for higher in upper for nb in higher], dtype=np.int64)
+        self.arcIndex = {}  # (lower node, higher node) -> arc id
+        self.upperArcs = []  # node id -> a list of (arc id, higher node), for the queries
+        for node, higher in enumerate(upper):
+            start = int(self.arcOffsets[node])
+            self.upperArcs.append([(start + i, nb) for i, nb in enumerate(higher)])
+            for i, nb in enumerate(higher):
+                self.arcIndex[(node, nb)] = start + i
+        # parent in the elimination tree: the lowest higher neighbor
+        self.parent = [higher[0] if higher else -1 for higher in upper]
+
+        # the lower triangles (x, u, v) with x lower than u and u lower than v, by the level of x, so
+        # the arcs of the intersections of one level are final before they are used
+        level = [0] * n
+        for node in order:
+            for nb in upper[node]:
+                level[nb] = max(level[nb], level[node] + 1)
+        triangles = []
+        for node in order:
+            higher = upper[node]
+            for i in xrange(len(higher)):
+                lowerArc = self.arcIndex[(node, higher[i])]
+                for j in xrange(i + 1, len(higher)):
+                    triangles.append((level[node], lowerArc, self.arcIndex[(node, higher[j])],
+                                      self.arcIndex[(higher[i], higher[j])]))
+        triangles.sort()
+        triangles = np.array(triangles, dtype=np.int64).reshape((-1, 4))
+        self.triangleLevels = triangles[:, 0]
+        self.triangleArcs = triangles[:, 1:]  # (arc x-u, arc x-v, arc u-v)
+        self.levelOffsets = np.searchsorted(self.triangleLevels, np.arange(max(level or [0]) + 2))
+
+        # the arc and the direction of each road
+        source = self.graph.edgeSource.astype(np.int64)
+        target = self.graph.edgeTarget.astype(np.int64)
+        self.edgeUp = self.rank[source] < self.rank[target]
+        low = np.where(self.edgeUp, source, target).tolist()
+        high = np.where(self.edgeUp, target, source).tolist()
+        self.edgeArc = np.array([self.arcIndex.get((l, h), -1) for l, h in zip(low, high)], dtype=np.int64)
+
+    def arcNum(self):
+        return len(self.arcHead)
+
+    def isStale(self, snapshot):
+        curtTime = Traffic.globalTime
+        if self.customizeTime is None or curtTime < self.customizeTime:  # the global time started from 0 again
+            return True
+        if self.customizeInterval:
+            return curtTime - self.customizeTime >= self.customizeInterval
+        snapshot.getTimes()
+        return snapshot.version != self.snapshotVersion
+
+    def customize(self, snapshot):
+        """
+        Put the published traffic times of the roads on the arcs.
+        :param snapshot: (TravelTimeSnapshot)
+        """
+        times = snapshot.getArray()
+        arcNum = self.arcNum()
+        self.upTimes, self.upEdge = self.roadTimes(times, self.edgeUp)
+        self.downTimes, self.downEdge = self.roadTimes(times, ~self.edgeUp)
+        self.upVia = np.full(arcNum, -1, dtype=np.int64)
+        self.downVia = np.full(arcNum, -1, dtype=np.int64)
+
+        # u -> v through x is u -> x (down on x-u) then x -> v (up on x-v), and v -> u the other way
+        for level in xrange(len(self.levelOffsets) - 1):
+            start, end = self.levelOffsets[level], self.levelOffsets[level + 1]
+            if start == end:
+                continue
+            xu, xv, uv = self.triangleArcs[start:end].T
+            triangles = np.arange(start, end)
+            self.relax(self.upTimes, self.upVia, uv, self.downTimes[xu] + self.upTimes[xv], triangles)
+            self.relax(self.downTimes, self.downVia, uv, self.downTimes[xv] + self.upTimes[xu], triangles)
+
+        self.upTimeList = self.upTimes.tolist()
+        self.downTimeList = self.downTimes.tolist()
+        self.upViaList = self.upVia.tolist()
+        self.downViaList = self.downVia.tolist()
+        self.upEdgeList = self.upEdge.tolist()
+        self.downEdgeList = self.downEdge.tolist()
+        self.customizeTime = Traffic.globalTime
+        self.snapshotVersion = snapshot.version
+        self.customizeNum += 1
+
+    def roadTimes(self, times, inDirection):
+        """
+        :param times: a NumPy array of the traffic time of each road by its edge id
+        :param inDirection: a NumPy bool array of the roads to use
+        :return: (the time of the quickest of the roads on each arc, its edge id) arrays; inf and -1 if none
+        """
+        arcTimes = np.full(self.arcNum(), np.inf)
+        arcEdges = np.full(self.arcNum(), -1, dtype=np.int64)
+        edges = np.flatnonzero(inDirection & (self.edgeArc >= 0))
+        if len(edges):
+            edges = edges[np.lexsort((times[edges], self.edgeArc[edges]))]
+            arcs, first = np.unique(self.edgeArc[edges], return_index=True)
+            arcTimes[arcs] = times[edges[first]]
+            arcEdges[arcs] = edges[first]
+        return arcTimes, arcEdges
+
+    @classmethod
+    def relax(cls, arcTimes, arcVia, arcs, candidates, triangles):
+        """
+        Lower the times of the arcs to the quickest of their candidates, and record its triangle.
+        """
+        order = np.lexsort((candidates, arcs))
+        arcs, first = np.unique(arcs[order], return_index=True)
+        best = candidates[order][first]
+        better = best < arcTimes[arcs]
+        arcs = arcs[better]
+        arcTimes[arcs] = best[better]
+        arcVia[arcs] = triangles[order][first][better]
+
+    def query(self, sourceIdx, targetIdx):
+        """
+        :param sourceIdx: the node id of the source intersection
+        :param targetIdx: the node id of the target intersection
+        :return: (the time, a list of the edge ids of the quickest route); (inf, None) if there is no route
+        """
+        forward, forwardArcs = self.searchUp(sourceIdx, self.upTimeList)
+        backward, backwardArcs = self.searchUp(targetIdx, self.downTimeList)
+        best = float("inf")
+        meeting = -1
+        for node, time in forward.iteritems():
+            if node in backward and time + backward[node] < best:
+                best = time + backward[node]
+                meeting = node
+        self.settledNum = len(forward) + len(backward)
+        if meeting < 0:
+            return best, None
+
+        edges = []
+        for arc in reversed(self.arcPath(meeting, forwardArcs)):
+            self.unpack(arc, True, edges)
+        for arc in self.arcPath(meeting, backwardArcs):
+            self.unpack(arc, False, edges)
+        return best, edges
+
+    def searchUp(self, start, arcTimes):
+        """
+        Relax the upward arcs of the ancestors of the start intersection in the elimination tree, which
+        are all the intersections reachable by upward arcs.
+        :param arcTimes: a list of the time of each arc in the direction of the search
+        :return: (dict of node id -> time, dict of node id -> (the arc to it, its lower node))
+        """
+        times = {start: 0.0}
+        arcs = {}
+        upperArcs = self.upperArcs
+        parent = self.parent
+        inf = float("inf")
+        node = start
+        while node >= 0:
+            time = times.get(node)
+            if time is not None:
+                for arc, head in upperArcs[node]:
+                    newTime = time + arcTimes[arc]
+                    if newTime < times.get(head, inf):
+                        times[head] = newTime
+                        arcs[head] = (arc, node)
+            node = parent[node]
+        return times, arcs
+
+    @classmethod
+    def arcPath(cls, node, arcs):
+        """
+        :return: a list of the arc ids from the node down to the start of the search
+        """
+        path = []
+        while node in arcs:
+            arc, node = arcs[node]
+            path.append(arc)
+        return path
+
+    def unpack(self, arc, isUp, edges):
+        """
+        Append the edge ids of the roads of the arc in the given direction to the edges.
+        :param isUp: True: from the lower to the higher intersection of the arc
+        """
+        stack = [(arc, isUp)]
+        while stack:
+            arc, isUp = stack.pop()
+            via = self.upViaList[arc] if isUp else self.downViaList[arc]
+            if via < 0:
+                edges.append(self.upEdgeList[arc] if isUp else self.downEdgeList[arc])
+                continue
+            xu, xv, _ = self.triangleArcList[via]
+            if isUp:  # u -> x -> v; the stack is last in first out
+                stack.append((xv, True))
+                stack.append((xu, False))
+            else:     # v -> x -> u
+                stack.append((xu, True))
+                stack.append((xv, False))
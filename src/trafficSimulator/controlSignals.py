@@ -18,6 +18,8 @@ class ControlSignals(object):
         self.stateNum = 0
         self.states = None
         self.inRoads = []
+        self.turnNumbers = None        # key: the edge id (RoadGraph) of an in-road, value: its order in self.inRoads
+        self.sourceTurnNumbers = None  # key: the node id of an in-road's source, value: the order of its first in-road
         self.pairNum = None  # the number of paired roads at this intersection.
 
     def generateState(self):
@@ -53,7 +55,29 @@ class ControlSignals(object):
         self.inRoads.extend(quadrant3)
         self.inRoads.extend(quadrant4)
 
-        # generate states: each state can only has two roads permitted to go through the intersection
+        self.buildStates()
+        self.stateNum = FixedRandom.randint(0, len(self.states) - 1)
+
+    def restoreState(self, inRoads, stateNum):
+        """
+        Restore the signal from an already sorted list of in-roads and the current state
+        (e.g. loaded from a compiled map) without drawing new random numbers.
+        :param inRoads: a list of (slope, Road) sorted counter-clockwise
+        :param stateNum: (int) the index of the current state
+        """
+        self.inRoads = inRoads
+        self.buildStates()
+        self.stateNum = stateNum
+
+    def buildStates(self):
+        """
+        Generate the states from the sorted in-roads: each state can only has two roads
+        permitted to go through the intersection
+        """
+        self.states = []
+        self.turnNumbers = None
+        self.sourceTurnNumbers = None
+
         self.pairNum = int(math.ceil(len(self.inRoads) / 2.0))
         for i in range(self.pairNum):
             l = ['' for _ in range(len(self.inRoads))]
@@ -65,7 +89,6 @@ class ControlSignals(object):
                 j += self.pairNum
             self.states.append(l)
             self.states.append(fr)
-        self.stateNum = FixedRandom.randint(0, len(self.states) - 1)
 
     def getSlopeQuadrant(self, road):
         """
@@ -103,6 +126,19 @@ class ControlSignals(object):
 
         return qd, slope
 
+    def buildTurnNumbers(self):
+        """
+        Map the in-roads to their orders by their RoadGraph ids. The signals are generated before the
+        graph gives the ids, so the maps are built at the first lookup.
+        """
+        self.turnNumbers = {}
+        self.sourceTurnNumbers = {}
+        for i, (_, road) in enumerate(self.inRoads):
+            if road.edgeIdx is not None:
+                self.turnNumbers[road.edgeIdx] = i
+            if road.source.nodeIdx is not None:
+                self.sourceTurnNumbers.setdefault(road.source.nodeIdx, i)
+
     def getTurnNumber(self, lane, isInRoad):
         """
         From the self.roads (which stores in-roads of the intersections),
@@ -115,16 +151,19 @@ class ControlSignals(object):
         if not self.states:
             self.generateState()
 
+        if self.turnNumbers is None:
+            self.buildTurnNumbers()
+
+        # an out-road is numbered as the in-road of the opposite direction, or the first in-road from its target
         if isInRoad:
-            targetPoint = lane.getSource().center.getCoords()
+            road, node = lane.road, lane.getSource().nodeIdx
         else:
-            targetPoint = lane.getTarget().center.getCoords()
-
-        for i in range(len(self.inRoads)):
-            qd, road = self.inRoads[i]
-            rdCoord = road.source.center.getCoords()
-            if targetPoint == rdCoord:
-                return i
+            road, node = lane.road.oppositeRoad, lane.getTarget().nodeIdx
+        turnNumber = self.turnNumbers.get(road.edgeIdx) if road and road.edgeIdx is not None else None
+        if turnNumber is None and node is not None:
+            turnNumber = self.sourceTurnNumbers.get(node)
+        if turnNumber is not None:
+            return turnNumber
 
         # ==== error message ====
         print "Err [ControlSignals]: Cannot find corresponding road number!"
@@ -6,6 +6,7 @@ from math import cos
 from math import sin
 from math import asin
 from math import sqrt
+import numpy as np
 import matplotlib as mpl
 
 from coordinate import Coordinate
@@ -119,6 +120,30 @@ def haversine(point1, point2):
     return c * r
 
 
+def haversineArray(points1, points2):
+    """
+    The vectorized version of haversine().
+
+    Args:
+      (numpy.ndarray) points1: (n, 2) array of (longitude, latitude)
+      (numpy.ndarray) points2: (n, 2) array of (longitude, latitude)
+    Return:
+      (numpy.ndarray) distances (in km) between the points
+    """
+    points1 = np.radians(points1)
+    points2 = np.radians(points2)
+    dlng = points2[:, 0] - points1[:, 0]
+    dlat = points2[:, 1] - points1[:, 1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(points1[:, 1]) * np.cos(points2[:, 1]) * np.sin(dlng / 2) ** 2
+    c = 2 * np.arcsin(np.sqrt(a))
+
+    if METER_TYPE == DistanceUnit.KM:
+        r = DistanceUnit.EARTH_RADIUS_KM
+    else:
+        r = DistanceUnit.EARTH_RADIUS_MILE
+    return c * r
+
+
 def distToGPSDiff(length):
     """
     Invert length in kilometer to GPS unit. Use the haversine function.
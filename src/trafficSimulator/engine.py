@@ -1,6 +1,7 @@
 import sys
 import math
 from trafficUtil import Traffic
+from vehicleStore import rowProperty
 
 
 class Engine(object):
@@ -8,14 +9,24 @@ class Engine(object):
     A car's engine. It calculate the speed.
     """
 
+    __slots__ = ("trajectory", "store", "row")
+
+    # the state in the VehicleStore
+    speed = rowProperty("speed")
+    maxSpeed = rowProperty("maxSpeed")
+
+    # the parameters are the same for all engines
+    maxAcceleration = 0.001  # the maximum acceleration (km/s^2)
+    maxDeceleration = 0.003  # the maximum deceleration (km/s^2)
+    timeHeadAway = 1.5  # second
+    distGap = 0.002  # km
+
     def __init__(self, trajectory, maxSpeed):
+        self.store = trajectory.car.store
+        self.row = trajectory.car.row
         self.speed = 0
         self.maxSpeed = maxSpeed
         self.trajectory = trajectory
-        self.maxAcceleration = 0.001  # the maximum acceleration (km/s^2)
-        self.maxDeceleration = 0.003  # the maximum deceleration (km/s^2)
-        self.timeHeadAway = 1.5  # second
-        self.distGap = 0.002  # km
 
     def setSpeed(self, speed):
         """
@@ -24,9 +35,16 @@ class Engine(object):
         speed limit of the road.
         :param speed: the new speed
         """
-        self.speed = min([self.maxSpeed,
-                          max(round(speed, 10), 0),
-                          self.trajectory.getRoad().getSpeedLimit()])
+        self.speed = self.limitSpeed(speed)
+        self.trajectory.setSpeed(self.speed)
+
+    def limitSpeed(self, speed):
+        """
+        :return: the given speed within 0, the maximum speed of this car and the speed limit of the road
+        """
+        return min([self.maxSpeed,
+                    max(round(speed, 10), 0),
+                    self.trajectory.getRoad().getSpeedLimit()])
 
     def getSpeed(self):
         return self.speed
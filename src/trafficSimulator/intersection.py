@@ -22,8 +22,11 @@ class Intersection(object):
         self.id = Traffic.uniqueId(RoadType.INTERSECTION)
         self.outRoads = []
         self.inRoads = []
+        self.outTargets = set()  # the target coordinates of the out-roads
+        self.inSources = set()   # the source coordinates of the in-roads
         self.controlSignals = ControlSignals(self)
         self.isSink = None
+        self.nodeIdx = None      # the node id in RoadGraph
 
     def update(self):
         for rd in self.outRoads:
@@ -49,12 +52,25 @@ class Intersection(object):
         return self.inRoads
 
     def addOutRoad(self, rd):
-        if rd.target.center.getCoords() not in [road.target.center.getCoords() for road in self.outRoads]:
+        coords = rd.target.center.getCoords()
+        if coords not in self.outTargets:
+            self.outTargets.add(coords)
             self.outRoads.append(rd)
 
     def addInRoad(self, rd):
-        if rd.source.center.getCoords() not in [road.source.center.getCoords() for road in self.inRoads]:
+        coords = rd.source.center.getCoords()
+        if coords not in self.inSources:
+            self.inSources.add(coords)
             self.inRoads.append(rd)
 
+    def setRoads(self, outRoads, inRoads):
+        """
+        Set the out- and in-roads that have been connected before (e.g. from a compiled map).
+        """
+        self.outRoads = outRoads
+        self.inRoads = inRoads
+        self.outTargets = set(rd.target.center.getCoords() for rd in outRoads)
+        self.inSources = set(rd.source.center.getCoords() for rd in inRoads)
+
     def buildControlSignal(self):
         self.controlSignals.generateState()
@@ -0,0 +1,130 @@
+import heapq
+import numpy as np
+from trafficUtil import Traffic
+from config import ALT_LANDMARK_NUM
+
+
+class Landmarks(object):
+    """
+    The free-flow times (each road's length at its speed limit) from a few landmark intersections to
+    every intersection and from every intersection to the landmarks, for the A* bounds of ALT routing
+    (A*, landmarks and the triangle inequality). A road is never faster than at its speed limit, so
+    for any intersections v and t and landmark L the live time from v to t is at least
+    d(L, t) - d(L, v) and d(v, L) - d(t, L), where d is the free-flow time. The bounds stay valid when
+    a speed limit is lowered (a crash), and the landmarks are computed again when one is raised.
+    """
+
+    UNREACHABLE = 1e18  # the time to an intersection that cannot be reached, finite so that it can be subtracted
+
+    # the bounds are lowered a little (second), so the rounding errors of the summed times cannot make
+    # them larger than the real times
+    BOUND_MARGIN = 1e-6
+
+    def __init__(self, graph, landmarkNum=ALT_LANDMARK_NUM):
+        """
+        :param graph: RoadGraph
+        :param landmarkNum: the number of landmarks
+        """
+        self.graph = graph
+        self.landmarkNum = landmarkNum
+        self.speedLimits = None    # edge id -> the speed limit (km/h) used for the free-flow times
+        self.landmarks = []        # the node ids of the landmarks
+        self.fromLandmark = None   # (node id, landmark) -> free-flow time from the landmark to the node
+        self.toLandmark = None     # (node id, landmark) -> free-flow time from the node to the landmark
+        self.checkedVersion = None  # the version of the travel time snapshot checked by isValid
+
+    def isValid(self, snapshot):
+        """
+        :param snapshot: (TravelTimeSnapshot) the published traffic times
+        :return: False if the landmarks are not computed or a speed limit is higher than when they were
+        """
+        if self.speedLimits is None:
+            return False
+        snapshot.getTimes()
+        if self.checkedVersion != snapshot.version:
+            if (snapshot.speedLimits > self.speedLimits).any():
+                return False
+            self.checkedVersion = snapshot.version
+        return True
+
+    def compute(self, speedLimits):
+        """
+        Choose the landmarks and compute their free-flow times.
+        :param speedLimits: a NumPy array of the speed limit of each road by its edge id
+        """
+        graph = self.graph
+        self.speedLimits = speedLimits.copy()
+        self.checkedVersion = None
+        lengths = np.array([rd.getLength() for rd in graph.edges])
+        weights = (lengths / speedLimits * Traffic.SECOND_PER_HOUR).tolist()
+        outOffsets = graph.outOffsets.tolist()
+        outEdges = graph.outEdges.tolist()
+        outTargets = graph.edgeTarget[graph.outEdges].tolist()
+        inOffsets = graph.inOffsets.tolist()
+        inEdges = graph.inEdges.tolist()
+        inSources = graph.edgeSource[graph.inEdges].tolist()
+
+        # Farthest selection: each landmark is the intersection of the largest component that is the
+        # farthest (there and back) from the landmarks chosen so far, starting from the one farthest
+        # from an arbitrary intersection. Landmarks at the edge of the map give the tightest bounds.
+        n = graph.nodeNum()
+        inGiant = graph.component == graph.giantComponent if n else np.zeros(0, dtype=bool)
+        candidates = np.flatnonzero(inGiant)
+        self.landmarks = []
+        fromTimes = []
+        toTimes = []
+        if len(candidates):
+            start = self.dijkstra(int(candidates[0]), outOffsets, outEdges, outTargets, weights)
+            nearest = np.where(inGiant, start, -1)
+            while len(self.landmarks) < min(self.landmarkNum, len(candidates)):
+                landmark = int(np.argmax(nearest))
+                if landmark in self.landmarks:
+                    break
+                self.landmarks.append(landmark)
+                fromTimes.append(self.dijkstra(landmark, outOffsets, outEdges, outTargets, weights))
+                toTimes.append(self.dijkstra(landmark, inOffsets, inEdges, inSources, weights))
+                roundTrip = np.where(inGiant, fromTimes[-1] + toTimes[-1], -1)
+                nearest = roundTrip if len(self.landmarks) == 1 else np.minimum(nearest, roundTrip)
+
+        self.fromLandmark = np.array(fromTimes).T.reshape((n, len(self.landmarks)))
+        self.toLandmark = np.array(toTimes).T.reshape((n, len(self.landmarks)))
+
+    @classmethod
+    def dijkstra(cls, source, offsets, edges, neighbors, weights):
+        """
+        :param source: the node id to start from
+        :param offsets, edges, neighbors: the CSR adjacency of the nodes, with the node at the other end of
+                                          each edge; in-adjacency gives the times to the source instead
+        :param weights: a list of the time of each edge
+        :return: a NumPy array of the shortest time between the source and each node
+        """
+        times = [cls.UNREACHABLE] * (len(offsets) - 1)
+        times[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            time, node = heapq.heappop(heap)
+            if time > times[node]:
+                continue
+            for i in xrange(offsets[node], offsets[node + 1]):
+                newTime = time + weights[edges[i]]
+                nxt = neighbors[i]
+                if newTime < times[nxt]:
+                    times[nxt] = newTime
+                    heapq.heappush(heap, (newTime, nxt))
+        return np.array(times)
+
+    def getLowerBound(self, targetInter):
+        """
+        :param targetInter: (Intersection) the target of the search
+        :return: a function that gives a lower bound of the time (second) from an intersection to the target
+        """
+        fromTarget = self.fromLandmark[targetInter.nodeIdx]
+        toTarget = self.toLandmark[targetInter.nodeIdx]
+        fromLandmark = self.fromLandmark
+        toLandmark = self.toLandmark
+
+        def lowerBound(inter):
+            node = inter.nodeIdx
+            bound = max(np.max(fromTarget - fromLandmark[node]), np.max(toLandmark[node] - toTarget))
+            return max(float(bound) - Landmarks.BOUND_MARGIN, 0)
+        return lowerBound
@@ -2,14 +2,20 @@ from __future__ import division
 
 import math
 import sys
+import numpy as np
 
 from coordinate import Coordinate
 from drawUtil import GPS_DIST_UNIT
 from config import MAX_SPEED
+from trafficUtil import FenwickTree
+from trafficUtil import CarType
 
 
 LANE_WIDTH = 0.020 / GPS_DIST_UNIT # km -> geo unit
 
+# the speed tree keeps the speeds as integers (Engine rounds speeds to 10 decimals), so its sums never drift
+SPEED_SCALE = 10 ** 10
+
 
 class Lane(object):
     """
@@ -30,13 +36,20 @@ class Lane(object):
         # self.length = haversine(self.source.center, self.target.center)
         # self.middleLine = None
         self.carsPosition = {}
+        self.queue = []  # the LanePositions on this lane sorted by their positions (from source to target)
+        self.speedTree = None  # the speeds of the cars in the queue's order; None: to be built (see getSpeedTree)
+        self.version = 0  # increased whenever a LanePosition enters, leaves or moves on this lane
+        self.speedSum = 0  # the sum of the scaled speeds (see scaleSpeed) of the cars on this lane
+        self.members = {CarType.CAR: set(), CarType.TAXI: set()}  # the cars on this lane by their type
         self.blocked = False
         self.rightLane = None
         self.laneIdx = None
+        self.storeIdx = None  # the index of this lane in the VehicleStore
 
         # for shifting the coordinates to indicate the positions at different lanes.
         self.shiftSource = None
         self.shiftTarget = None
+        self.shiftVector = None  # (lng, lat) from shiftSource to shiftTarget
 
     # def getSourceSideId(self):
     #     return self.road.sourceSideId
@@ -97,23 +110,134 @@ class Lane(object):
         :param a: the relative position from 0(source) to 1(target)
         :return: (longitude, latitude)
         """
-        if self.shiftSource is None or self.shiftTarget is None:
+        if self.shiftVector is None:
             self.updateShift()
 
         a = min(a, 1)
-        lng = self.shiftSource.lng + (self.shiftTarget.lng - self.shiftSource.lng) * a
-        lat = self.shiftSource.lat + (self.shiftTarget.lat - self.shiftSource.lat) * a
+        lng = self.shiftSource.lng + self.shiftVector[0] * a
+        lat = self.shiftSource.lat + self.shiftVector[1] * a
         return lng, lat
 
+    def setShift(self, sourceLng, sourceLat, targetLng, targetLat):
+        """
+        Set the shifted source and target coordinates of this lane (computed by RoadGeometry).
+        """
+        self.shiftSource = Coordinate(sourceLng, sourceLat)
+        self.shiftTarget = Coordinate(targetLng, targetLat)
+        self.shiftVector = targetLng - sourceLng, targetLat - sourceLat
+
     def addCarPosition(self, carPos):
         """
         Add the given carPos (LanePosition) to the self.carsPosition dictionary
+        and to the position-sorted queue.
         :param carPos: (LanePosition)
         """
         if carPos.id in self.carsPosition:
-            print carPos.car.id, carPos.id, "is already on", self.road.id
+            print carPos.car.name, carPos.id, "is already on", self.road.id
         else:
             self.carsPosition[carPos.id] = carPos
+            self.insertQueue(carPos)
+            self.speedSum += Lane.scaleSpeed(carPos.speed)
+            self.members[carPos.car.vehicleType].add(carPos.car)
+
+    def searchQueue(self, position, right):
+        """
+        Binary search of the queue by position.
+        :param position: absolute position
+        :param right: True: return the index after the LanePositions at the given position;
+                      False: return the index before them
+        :return: index of the queue
+        """
+        lo, hi = 0, len(self.queue)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            p = self.queue[mid].position
+            if p < position or (right and p == position):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def queueIndex(self, carPos):
+        """
+        :return: the index of the LanePosition in the queue
+        """
+        i = self.searchQueue(carPos.position, False)
+        while self.queue[i] is not carPos:
+            i += 1
+        return i
+
+    def getSpeedTree(self):
+        """
+        The speed tree is built when it is needed after the queue changes, so adding many cars
+        to the lane (e.g. when placing the initial cars) only builds it once.
+        """
+        if self.speedTree is None:
+            self.speedTree = FenwickTree([Lane.scaleSpeed(cp.speed) for cp in self.queue])
+        return self.speedTree
+
+    def updateCarSpeed(self, carPos, speed):
+        """
+        Update the speed of the LanePosition on this lane in the speed tree.
+        :param carPos: (LanePosition) a LanePosition on this lane
+        :param speed: the new speed
+        """
+        if speed != carPos.speed:
+            delta = Lane.scaleSpeed(speed) - Lane.scaleSpeed(carPos.speed)
+            self.speedSum += delta
+            self.road.speedSum += delta
+            if self.speedTree is not None:
+                self.speedTree.add(self.queueIndex(carPos), delta)
+        carPos.speed = speed
+
+    @classmethod
+    def scaleSpeed(cls, speed):
+        return int(round(speed * SPEED_SCALE))
+
+    def insertQueue(self, carPos):
+        """
+        Insert the LanePosition into the queue after the ones at the same position,
+        and link it with its follower and leader.
+        """
+        i = self.searchQueue(carPos.position, True)
+        self.queue.insert(i, carPos)
+        self.speedTree = None
+        self.version += 1
+        carPos.follower = self.queue[i - 1] if i > 0 else None
+        carPos.leader = self.queue[i + 1] if i + 1 < len(self.queue) else None
+        if carPos.follower:
+            carPos.follower.leader = carPos
+        if carPos.leader:
+            carPos.leader.follower = carPos
+
+    def removeQueue(self, carPos):
+        """
+        Remove the LanePosition from the queue and link its follower and leader together.
+        """
+        del self.queue[self.queueIndex(carPos)]
+        self.speedTree = None
+        self.version += 1
+        if carPos.follower:
+            carPos.follower.leader = carPos.leader
+        if carPos.leader:
+            carPos.leader.follower = carPos.follower
+        carPos.leader = carPos.follower = None
+
+    def updateCarPosition(self, carPos, position):
+        """
+        Move the LanePosition on this lane to the given position. It only needs to be moved in the
+        queue when it passes its leader or follower.
+        :param carPos: (LanePosition) a LanePosition on this lane
+        :param position: the new absolute position
+        """
+        self.version += 1
+        leader, follower = carPos.leader, carPos.follower
+        if (leader is None or position <= leader.position) and (follower is None or follower.position <= position):
+            carPos.position = position
+        else:
+            self.removeQueue(carPos)
+            carPos.position = position
+            self.insertQueue(carPos)
 
     # def isCarPositionEmpty(self, pos):            # TODO: check position is empty
     #     for pos in self.carsPosition.values():
@@ -121,20 +245,28 @@ class Lane(object):
 
     def getFrontAvgSpeed(self, pos):
         """
-        Get the average speed of cars in front of the given position.
+        Get the average speed of cars in front of the given position (the rear of the car is after the position).
+        All cars have the same length, so they are a suffix of the queue and the speed tree gives their sum.
         :param pos: absolute position
         :return: the average speed in front of the given position
         """
-        frontCarSpeed = [cp.getCar().getSpeed() for cp in self.carsPosition.values()
-                                                if cp.getPosition() - cp.getCar().length / 2 > pos]
-        if not frontCarSpeed:
+        lo, hi = 0, len(self.queue)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cp = self.queue[mid]
+            if cp.position - cp.car.length / 2 > pos:
+                hi = mid
+            else:
+                lo = mid + 1
+        frontCarNum = len(self.queue) - lo
+        if not frontCarNum:
             return sys.maxint
-        return sum(frontCarSpeed) / len(frontCarSpeed)
+        speedTree = self.getSpeedTree()
+        return (speedTree.total() - speedTree.prefixSum(lo)) / frontCarNum / SPEED_SCALE
 
     def getCurAvgLaneSpeed(self):
-        carsSpd = [pos.car.getSpeed() for pos in self.carsPosition.values()]
-        if len(carsSpd) > 0:
-            return sum(carsSpd) / len(carsSpd)
+        if self.queue:
+            return self.speedSum / len(self.queue) / SPEED_SCALE
         else:
             return MAX_SPEED
 
@@ -142,10 +274,13 @@ class Lane(object):
         if carPos.id not in self.carsPosition:
             print "removing unknown car"
         del self.carsPosition[carPos.id]
+        self.removeQueue(carPos)
+        self.speedSum -= Lane.scaleSpeed(carPos.speed)
+        self.members[carPos.car.vehicleType].discard(carPos.car)
 
     def getNext(self, carPos):
         """
-        Find the car in front of the given parameter "carPos".
+        Find the car in front of the given parameter "carPos" by following the leader links.
         :param carPos: a LanePosition of a car
         :return: the front car's LanePositions
         """
@@ -153,26 +288,19 @@ class Lane(object):
             print "car is on other lane"
             return None
 
-        nextLanePos = None
-        shortestDist = sys.maxint
-        for cp in self.carsPosition.itervalues():
-            if cp.isGoalFlag:
-                nextLanePos.append(cp)
-                continue
-            if cp.position is None:
-                print "the car has no position"
-                continue
-            if cp.car.id == carPos.car.id:
-                continue
-            distance = cp.position - carPos.position
-            if not cp.free and (0 < distance < shortestDist):  # only pick the cars in front of current car
-                shortestDist = distance
-                nextLanePos = cp
+        # only pick the cars in front of current car
+        nextLanePos = carPos.leader
+        while nextLanePos is not None and \
+                (nextLanePos.position <= carPos.position or nextLanePos.car.id == carPos.car.id):
+            nextLanePos = nextLanePos.leader
         return nextLanePos
 
     def getCars(self):
         return [cp.car for cp in self.carsPosition.values()]
 
+    def getCarNum(self):
+        return len(self.queue)
+
     def isBlocked(self):
         return self.blocked
 
@@ -180,22 +308,40 @@ class Lane(object):
         self.blocked = b
 
     def getAvgSpeed(self):
-        if len(self.carsPosition) == 0:
+        if not self.queue:
             return sys.maxint
-        return sum([lanePos.car.getSpeed() for lanePos in self.carsPosition.values()]) / len(self.carsPosition)
+        return self.speedSum / len(self.queue) / SPEED_SCALE
 
     def canSwitchLane(self, position):
         """
         Check there is enough room for the car on the neighbor lane to switch to this lane.
+        The queue is an index of the cars' extents: all cars have the same length, so the last car
+        whose rear is before the position is the only one that can cover it.
         :param position:
         :return: boolean
         """
-        carPositions = [(c.position - c.car.length / 2, c.position + c.car.length / 2)
-                        for c in self.carsPosition.values()]
-        for rear, front in carPositions:
-            if rear <= position <= front:
-                return False
-        return True
+        lo, hi = 0, len(self.queue)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cp = self.queue[mid]
+            if cp.position - cp.car.length / 2 <= position:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return True
+        cp = self.queue[lo - 1]
+        return not position <= cp.position + cp.car.length / 2
+
+    def hasCarBetween(self, low, high):
+        """
+        Check whether there is a car whose position is in the open interval (low, high).
+        :param low: absolute position; None: from the source of the lane
+        :param high: absolute position
+        :return: boolean
+        """
+        i = 0 if low is None else self.searchQueue(low, True)
+        return i < len(self.queue) and self.queue[i].position < high
 
     def updateShift(self):
         """
@@ -216,15 +362,12 @@ class Lane(object):
         target = self.road.getTarget().getCoords()  # lng, lat
         vector = target[0] - source[0], target[1] - source[1]
         if vector[0] == 0:  # vertical lane
-            self.shiftSource = Coordinate(source[0], source[1] + shiftDist)
-            self.shiftTarget = Coordinate(target[0], target[1] + shiftDist)
+            lngShift, latShift = 0, shiftDist
         elif vector[1] == 0:  # horizontal lane
-            self.shiftSource = Coordinate(source[0] + shiftDist, source[1])
-            self.shiftTarget = Coordinate(target[0] + shiftDist, target[1])
+            lngShift, latShift = shiftDist, 0
         else:
             lngShift, latShift = Lane.shiftUnit(vector, shiftDist)
-            self.shiftSource = Coordinate(source[0] + lngShift, source[1] + latShift)
-            self.shiftTarget = Coordinate(target[0] + lngShift, target[1] + latShift)
+        self.setShift(source[0] + lngShift, source[1] + latShift, target[0] + lngShift, target[1] + latShift)
 
     def laneIndex(self):
         if self.laneIdx is None:
@@ -266,3 +409,30 @@ class Lane(object):
                 lat *= -1
 
         return lat * lngLatRatio, lat
+
+    @classmethod
+    def shiftArray(cls, vectors, dists):
+        """
+        The vectorized version of the shift in updateShift() for all lanes of all roads.
+
+        :param vectors: (n, 2) array of the roads' (lng, lat) vectors
+        :param dists: (m,) array of the shift distances of the lanes
+        :return: (n, m, 2) array of the (lng, lat) shifts
+        """
+        vx = vectors[:, 0][:, np.newaxis]
+        vy = vectors[:, 1][:, np.newaxis]
+        dists = np.asarray(dists, dtype=np.float64)[np.newaxis, :]
+
+        # the vertical lanes divide by zero here, but they are replaced below
+        with np.errstate(divide="ignore", invalid="ignore"):
+            lngLatRatio = -vy / vx
+            lat = dists / np.sqrt(1 + lngLatRatio * lngLatRatio)
+            flip = np.where(vx * vy > 0, vy > 0, vy < 0)
+            lat = np.where(flip, -lat, lat)
+            lng = lat * lngLatRatio
+
+        vertical = (vx == 0) & np.ones_like(dists, dtype=bool)
+        horizontal = (vy == 0) & ~vertical
+        lngShift = np.where(vertical, 0, np.where(horizontal, dists, lng))
+        latShift = np.where(vertical, dists, np.where(horizontal, 0, lat))
+        return np.dstack((lngShift, latShift))
@@ -3,6 +3,8 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 from trafficUtil import Traffic
+from vehicleStore import VehicleStore
+from vehicleStore import slotProperty
 
 
 class LanePosition(object):
@@ -10,18 +12,42 @@ class LanePosition(object):
     A class that represents the position of a car on a lane.
     """
 
-    def __init__(self, car, lane=None, position=0):
+    __slots__ = ("car", "store", "row", "slot", "laneObject", "id", "free", "isGoalFlag", "speed", "leader", "follower",
+                 "nextCarCache")
+
+    # the position in the VehicleStore
+    position = slotProperty("position")
+
+    def __init__(self, car, lane=None, position=0, slot=VehicleStore.CURRENT):
         """
         :param car: Car object
         :param lane: Lane object, this lane that the given car is moving on
         :param position: The relative position (0~1) of this car on the lane
+        :param slot: VehicleStore.CURRENT or VehicleStore.NEXT, the slot of the car's row for this LanePosition
         """
         self.car = car
+        self.store = car.store
+        self.row = car.row
+        self.slot = slot
         self.lane = lane
         self.position = position
-        self.id = Traffic.uniqueId("lanePosition")
+        self.id = Traffic.uniqueNumber("lanePosition")
         self.free = True  # True: this LanePosition is released; False: this LanePosition has been added to a lane
         self.isGoalFlag = False
+        self.speed = 0  # the speed of the car (kept by the trajectory for the lane's speed tree)
+        self.leader = None    # the LanePosition in front of this one on the lane (set by the lane)
+        self.follower = None  # the LanePosition behind this one on the lane (set by the lane)
+        self.nextCarCache = None  # (lane, lane's version, nextCar, distance) of the last nextCarDistance call
+
+    @property
+    def lane(self):
+        return self.laneObject
+
+    @lane.setter
+    def lane(self, lane):
+        # the store keeps the lane's index; the object is kept here to avoid looking it up on every read
+        self.store.setLane(self.row, self.slot, lane)
+        self.laneObject = lane
 
     def setGoal(self):
         self.isGoalFlag = True
@@ -52,17 +78,40 @@ class LanePosition(object):
         return self.position
 
     def setPosition(self, pos):
-        self.position = pos
+        """
+        Set the position. If this LanePosition is on the lane, also keep the lane's queue in order.
+        """
+        if not self.free and self.lane:
+            self.lane.updateCarPosition(self, pos)
+        else:
+            self.position = pos
+
+    def setSpeed(self, speed):
+        """
+        Set the car's speed. If this LanePosition is on the lane, also update the lane's speed tree.
+        """
+        if not self.free and self.lane:
+            self.lane.updateCarSpeed(self, speed)
+        else:
+            self.speed = speed
 
     def addPosition(self, pos):
-        self.position = max(0, self.position + pos)  # no backward
-        self.position = min(self.position, self.lane.getLength())
+        position = max(0, self.position + pos)  # no backward
+        self.setPosition(min(position, self.lane.getLength()))
 
     def nextCarDistance(self):
         """
         Find the nearest car in front of this car and the distance.
+        The result is cached until the lane changes (any car on it enters, leaves or moves),
+        so the engine and the move of the same tick share one search.
         :return: the nearest car, distance (km)
         """
+        onLane = not self.free and self.lane
+        if onLane:
+            cache = self.nextCarCache
+            if cache is not None and cache[0] is self.lane and cache[1] == self.lane.version:
+                return cache[2], cache[3]
+
         # get the LanePosition in front of this car
         nextLanePosition = self.getNext()
         # calculate the head position of this car
@@ -79,6 +128,8 @@ class LanePosition(object):
                 nextCar = nextLanePosition.car
                 nextRearPos = rearPosition
 
+        if onLane:
+            self.nextCarCache = (self.lane, self.lane.version, nextCar, nextRearPos - frontPosition)
         return nextCar, nextRearPos - frontPosition
 
     def acquire(self):
@@ -88,6 +139,7 @@ class LanePosition(object):
         if self.lane:
             self.free = False
             self.lane.addCarPosition(self)
+            self.getRoad().addCar(self.car, self.speed)
             self.getRoad().addCarDriveTime(self.car.id, Traffic.globalTime, self.relativePosition())
 
     def release(self):
@@ -97,8 +149,22 @@ class LanePosition(object):
         if not self.free and self.lane:
             self.free = True
             self.lane.removeCar(self)
+            self.getRoad().removeCar(self.car, self.speed)
             self.getRoad().deleteCarDriveTime(self.car.id, Traffic.globalTime, self.relativePosition())
 
+    def changeLane(self, lane):
+        """
+        Move this LanePosition to another lane of the same road. Only the lanes are updated; the road
+        keeps counting the car and its drive time record goes on.
+        :param lane: a lane of the same road
+        """
+        if not self.free and self.lane:
+            self.lane.removeCar(self)
+            self.lane = lane
+            lane.addCarPosition(self)
+        else:
+            self.lane = lane
+
     def updateCarDriveTime(self):
         self.getRoad().updateCarDriveTime(self.car.id, self.relativePosition())
 
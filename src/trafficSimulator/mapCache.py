@@ -0,0 +1,329 @@
+from __future__ import division
+import os
+import hashlib
+import json
+import struct
+import numpy as np
+
+from road import Road
+from intersection import Intersection
+from coordinate import Coordinate
+from sinkSource import SinkSource
+from trafficUtil import Traffic
+from trafficUtil import RoadType
+from fixedRandom import FixedRandom
+from shapefileIndex import hashShapefile
+from config import LIGHT_FLIP_INTERVAL
+from config import MAJOR_ROAD_MIN_LEN
+from config import MAX_ROAD_LANE_NUM
+from config import MIN_SINK_SOURCE_ROAD_LENGTH
+from config import ROAD_OFFSET_FOR_SINK_SOURCE_POINT
+from config import PRUNE_UNREACHABLE_FRAGMENTS
+from config import MAP_CACHE_CHECK_CONTENT
+
+
+class MapCache(object):
+    """
+    A compiled map file. It stores the finished topology of a RealMap (intersections, directed
+    roads, lanes, traffic signals, and sink/source points) so that the map can be loaded without
+    parsing the shapefile and running createMap again.
+
+    File layout:
+        MAGIC (8 bytes) | header length (uint64) | JSON header (padded) | arrays
+    The header records the version, the key, the content hash of the shapefile (with
+    MAP_CACHE_CHECK_CONTENT), and the dtype, shape and offset (from the end of the header) of every array.
+    The arrays are loaded with numpy.memmap.
+    """
+
+    MAGIC = "TSMAPC\x00\x00"
+    VERSION = 4
+    ALIGN = 16
+
+    def __init__(self, folder, shapefileName, digest, dataNum, seed, region=None):
+        """
+        :param folder: the folder for storing the compiled map files
+        :param shapefileName: the file name of the shapefile
+        :param digest: (str) the hex digest of the shapefile from stampShapefile
+        :param dataNum: the number of shape file records to be read (MAP_SIZE)
+        :param seed: the random seed (RANDOM_SEED)
+        :param region: the MapRegion to be loaded; None for the first dataNum records
+        """
+        self.folder = folder
+        self.key = MapCache.makeKey(digest, dataNum, seed, region)
+        self.contentHash = hashShapefile(shapefileName).hexdigest() if MAP_CACHE_CHECK_CONTENT else None
+        self.filename = os.path.join(folder, "map_%s.bin" % self.key)
+
+    @classmethod
+    def makeKey(cls, digest, dataNum, seed, region=None):
+        """
+        Hash the shapefile's digest (its size and modification time) together with the map size (or region),
+        random seed, file version and the settings that change the stored map.
+        :return: (str) hex digest
+        """
+        sha = hashlib.sha1(digest)
+        if region is None:
+            sha.update("|%d|%d|%d" % (cls.VERSION, dataNum, seed))
+        else:
+            sha.update("|%d|%s|%d" % (cls.VERSION, region.key(), seed))
+        sha.update("|%s" % cls.settingsKey())
+        return sha.hexdigest()
+
+    @classmethod
+    def settingsKey(cls):
+        """
+        :return: (str) the settings whose results are stored in the file: the major roads, the number of
+                 lanes and the (pruned) sink/source points
+        """
+        settings = [MAJOR_ROAD_MIN_LEN, MAX_ROAD_LANE_NUM, MIN_SINK_SOURCE_ROAD_LENGTH, ROAD_OFFSET_FOR_SINK_SOURCE_POINT,
+                    PRUNE_UNREACHABLE_FRAGMENTS]
+        return "|".join(repr(setting) for setting in settings)
+
+    def exists(self):
+        return os.path.exists(self.filename)
+
+    # ========================================================================
+    # Writing
+    # ========================================================================
+    def save(self, realMap):
+        """
+        Compile the given map and write it to self.filename.
+        :param realMap: a RealMap that has been created
+        """
+        inters = list(realMap.getIntersections().values())
+        roads = list(realMap.getRoads().values())
+        interIndex = dict((inter.id, i) for i, inter in enumerate(inters))
+        roadIndex = dict((rd.id, i) for i, rd in enumerate(roads))
+        mapInterNum = len(inters)
+        mapRoadNum = len(roads)
+
+        def indexOf(obj, index, objs):
+            # the road lists of the intersections may refer to objects that were removed from the map
+            if obj.id not in index:
+                index[obj.id] = len(objs)
+                objs.append(obj)
+            return index[obj.id]
+
+        def flatten(lists):
+            offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(l) for l in lists])
+            values = [v for l in lists for v in l]
+            return offsets, values
+
+        # the road lists may add new intersections and the other way around, so repeat until
+        # every object in the tables has its rows
+        interOut, interIn, signalRoads, signalSlopes = [], [], [], []
+        roadSource, roadTarget = [], []
+        while len(interOut) < len(inters) or len(roadSource) < len(roads):
+            while len(interOut) < len(inters):
+                inter = inters[len(interOut)]
+                interOut.append([indexOf(rd, roadIndex, roads) for rd in inter.getOutRoads()])
+                interIn.append([indexOf(rd, roadIndex, roads) for rd in inter.getInRoads()])
+                signalRoads.append([indexOf(rd, roadIndex, roads) for _, rd in inter.controlSignals.inRoads])
+                signalSlopes.append([slope for slope, _ in inter.controlSignals.inRoads])
+            while len(roadSource) < len(roads):
+                rd = roads[len(roadSource)]
+                roadSource.append(indexOf(rd.getSource(), interIndex, inters))
+                roadTarget.append(indexOf(rd.getTarget(), interIndex, inters))
+
+        points = []
+        pointIndex = {}
+
+        def pointsOf(sinkSources):
+            result = []
+            for point in sinkSources:
+                if id(point) not in pointIndex:
+                    pointIndex[id(point)] = len(points)
+                    points.append(point)
+                result.append(pointIndex[id(point)])
+            return result
+
+        sink = pointsOf(realMap.sink)
+        source = pointsOf(realMap.source)
+        majorRoadSinkSource = pointsOf(realMap.majorRoadSinkSource)
+
+        arrays = {}
+        arrays["interId"] = np.array([Traffic.idNumber(inter.id) for inter in inters], dtype=np.int64)
+        arrays["interInMap"] = np.arange(len(inters)) < mapInterNum
+        arrays["interCenter"] = np.array([inter.center.getCoords() for inter in inters],
+                                         dtype=np.float64).reshape(-1, 2)
+        offsets, values = flatten([[c.getCoords() for c in inter.corners] for inter in inters])
+        arrays["interCornerOffsets"] = offsets
+        arrays["interCorners"] = np.array(values, dtype=np.float64).reshape(-1, 2)
+        arrays["interOutOffsets"], values = flatten(interOut)
+        arrays["interOut"] = np.array(values, dtype=np.int32)
+        arrays["interInOffsets"], values = flatten(interIn)
+        arrays["interIn"] = np.array(values, dtype=np.int32)
+        arrays["signalOffsets"], values = flatten(signalRoads)
+        arrays["signalRoads"] = np.array(values, dtype=np.int32)
+        _, values = flatten(signalSlopes)
+        arrays["signalSlopes"] = np.array(values, dtype=np.float64)
+        arrays["signalFlip"] = np.array([inter.controlSignals.flipMultiplier for inter in inters],
+                                        dtype=np.float64)
+        arrays["signalState"] = np.array([inter.controlSignals.stateNum if inter.controlSignals.states else -1
+                                          for inter in inters], dtype=np.int64)
+
+        arrays["roadId"] = np.array([Traffic.idNumber(rd.id) for rd in roads], dtype=np.int64)
+        arrays["roadInMap"] = np.arange(len(roads)) < mapRoadNum
+        arrays["roadSource"] = np.array(roadSource, dtype=np.int32)
+        arrays["roadTarget"] = np.array(roadTarget, dtype=np.int32)
+        arrays["roadLaneNum"] = np.array([len(rd.getLanes()) for rd in roads], dtype=np.int32)
+        arrays["roadSpeedLimit"] = np.array([rd.speedLimit for rd in roads], dtype=np.float64)
+        arrays["roadMajor"] = np.array([rd.isMajorRoad for rd in roads], dtype=np.bool_)
+        arrays["roadCenter"] = np.array([rd.center.getCoords() for rd in roads], dtype=np.float64).reshape(-1, 2)
+        offsets, values = flatten([[c.getCoords() for c in rd.corners] for rd in roads])
+        arrays["roadCornerOffsets"] = offsets
+        arrays["roadCorners"] = np.array(values, dtype=np.float64).reshape(-1, 2)
+
+        arrays["pointInter"] = np.array([interIndex[p.inter.id] if p.isIntersection() else -1 for p in points],
+                                        dtype=np.int32)
+        arrays["pointRoad"] = np.array([-1 if p.isIntersection() else roadIndex[p.road.id] for p in points],
+                                       dtype=np.int32)
+        arrays["pointPosition"] = np.array([p.position for p in points], dtype=np.float64)
+        arrays["sink"] = np.array(sink, dtype=np.int32)
+        arrays["source"] = np.array(source, dtype=np.int32)
+        arrays["majorRoadSinkSource"] = np.array(majorRoadSinkSource, dtype=np.int32)
+
+        randState = FixedRandom.rand.getstate()
+        header = {
+            "version": MapCache.VERSION,
+            "key": self.key,
+            "contentHash": self.contentHash,
+            "board": list(realMap.board),
+            "giantComponent": realMap.graph.giantComponent,
+            "counters": dict((idType, Traffic.uniqueid[idType])
+                             for idType in [RoadType.ROAD, RoadType.INTERSECTION, "ControlSignal"]),
+            "randomState": [randState[0], list(randState[1]), randState[2]],
+            "arrays": {},
+        }
+        offset = 0
+        for name in sorted(arrays):
+            arr = np.ascontiguousarray(arrays[name])
+            arrays[name] = arr
+            header["arrays"][name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+            offset += MapCache.aligned(arr.nbytes)
+
+        headerBytes = json.dumps(header)
+        dataStart = MapCache.aligned(len(MapCache.MAGIC) + 8 + len(headerBytes))
+        headerBytes = headerBytes.ljust(dataStart - len(MapCache.MAGIC) - 8)
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        tmpName = self.filename + ".tmp"
+        with open(tmpName, "wb") as f:
+            f.write(MapCache.MAGIC)
+            f.write(struct.pack("<Q", len(headerBytes)))
+            f.write(headerBytes)
+            for name in sorted(arrays):
+                data = arrays[name].tostring()
+                f.write(data)
+                f.write("\x00" * (MapCache.aligned(len(data)) - len(data)))
+        os.rename(tmpName, self.filename)
+        print "Compiled map is saved to", self.filename
+
+    @classmethod
+    def aligned(cls, n):
+        return (n + cls.ALIGN - 1) // cls.ALIGN * cls.ALIGN
+
+    # ========================================================================
+    # Reading
+    # ========================================================================
+    def readArrays(self):
+        """
+        Read the header and map each array in the file.
+        :return: (header, a dictionary of numpy.memmap); (None, None) if the file is not valid
+        """
+        with open(self.filename, "rb") as f:
+            if f.read(len(MapCache.MAGIC)) != MapCache.MAGIC:
+                return None, None
+            headerLen, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(headerLen))
+        dataStart = len(MapCache.MAGIC) + 8 + headerLen
+        if header["version"] != MapCache.VERSION or header["key"] != self.key:
+            return None, None
+        if self.contentHash and header["contentHash"] != self.contentHash:
+            return None, None
+
+        arrays = {}
+        for name, info in header["arrays"].items():
+            shape = tuple(info["shape"])
+            if 0 in shape:
+                arrays[name] = np.zeros(shape, dtype=np.dtype(str(info["dtype"])))
+            else:
+                arrays[name] = np.memmap(self.filename, dtype=np.dtype(str(info["dtype"])), mode="r",
+                                         offset=dataStart + info["offset"], shape=shape)
+        return header, arrays
+
+    def load(self, realMap):
+        """
+        Load the compiled map into the given RealMap.
+        :param realMap: a RealMap without roads and intersections
+        :return: True if the map is loaded; False if the file is not valid
+        """
+        header, a = self.readArrays()
+        if header is None:
+            print "Compiled map %s is out of date" % self.filename
+            return False
+
+        # plain array views of the memmaps; the values are converted to Python numbers for the map objects
+        c = dict((name, np.asarray(arr)) for name, arr in a.items())
+
+        def corners(offsets, values, i):
+            return [Coordinate(lng, lat) for lng, lat in values[offsets[i]:offsets[i + 1]].tolist()]
+
+        def rows(offsets, values, i):
+            return values[offsets[i]:offsets[i + 1]].tolist()
+
+        inters = []
+        for i, interId in enumerate(c["interId"]):
+            lng, lat = c["interCenter"][i].tolist()
+            inter = Intersection(corners(c["interCornerOffsets"], c["interCorners"], i), Coordinate(lng, lat), None)
+            inter.id = "%s_%d" % (RoadType.INTERSECTION, interId)
+            inters.append(inter)
+
+        roads = []
+        for i, roadId in enumerate(c["roadId"]):
+            lng, lat = c["roadCenter"][i].tolist()
+            rd = Road(corners(c["roadCornerOffsets"], c["roadCorners"], i), Coordinate(lng, lat),
+                      inters[c["roadSource"][i]], inters[c["roadTarget"][i]], float(c["roadSpeedLimit"][i]),
+                      deferLength=True)
+            rd.id = "%s_%d" % (RoadType.ROAD, roadId)
+            rd.isMajorRoad = bool(c["roadMajor"][i])
+            del rd.lanes[int(c["roadLaneNum"][i]):]
+            roads.append(rd)
+
+        for i, inter in enumerate(inters):
+            inter.setRoads([roads[j] for j in rows(c["interOutOffsets"], c["interOut"], i)],
+                           [roads[j] for j in rows(c["interInOffsets"], c["interIn"], i)])
+            signals = inter.controlSignals
+            signals.flipMultiplier = float(c["signalFlip"][i])
+            signals.flipInterval = signals.flipMultiplier * LIGHT_FLIP_INTERVAL
+            if c["signalState"][i] >= 0:
+                signals.restoreState(zip(rows(c["signalOffsets"], c["signalSlopes"], i),
+                                         [roads[j] for j in rows(c["signalOffsets"], c["signalRoads"], i)]),
+                                     int(c["signalState"][i]))
+
+        points = []
+        for i, interIdx in enumerate(c["pointInter"]):
+            if interIdx >= 0:
+                points.append(SinkSource(inters[interIdx]))
+            else:
+                points.append(SinkSource(None, roads[c["pointRoad"][i]], float(c["pointPosition"][i])))
+
+        realMap.intersections = dict((inters[i].id, inters[i]) for i in np.flatnonzero(c["interInMap"]))
+        mapRoads = [roads[i] for i in np.flatnonzero(c["roadInMap"])]
+        realMap.roads = dict((rd.id, rd) for rd in mapRoads)
+        realMap.buildGeometry()
+        realMap.buildGraph()
+        realMap.graph.giantComponent = header["giantComponent"]
+        realMap.splitMajorRoads(mapRoads)
+        realMap.sink = [points[i] for i in c["sink"]]
+        realMap.source = [points[i] for i in c["source"]]
+        realMap.majorRoadSinkSource = [points[i] for i in c["majorRoadSinkSource"]]
+        realMap.board = tuple(header["board"])
+
+        # continue the ids and the random numbers as if the map has been created
+        for idType, count in header["counters"].items():
+            Traffic.uniqueid[str(idType)] = count
+        version, state, gauss = header["randomState"]
+        FixedRandom.rand.setstate((version, tuple(state), gauss))
+        return True
@@ -1,5 +1,11 @@
+import sys
 import heapq
-from trafficUtil import RouteWeight
+from trafficUtil import Traffic
+from drawUtil import haversine
+from landmarks import Landmarks
+from contractionHierarchy import ContractionHierarchy
+from routeCache import RouteCache
+from config import ROUTING_ALGORITHM
 
 
 class Navigator(object):
@@ -10,23 +16,62 @@ class Navigator(object):
 
     MAX_TIME = 1000000000  # The maximum time for the environment. When it is reached, start from 0 again.
 
+    DIJKSTRA = "dijkstra"
+    ASTAR = "astar"
+    ALT = "alt"
+    CCH = "cch"
+
+    # the lower bounds are shrunk a little, so the rounding errors cannot make them larger than the real times
+    LOWER_BOUND_SCALE = 1 - 1e-9
+
     def __init__(self, realMap):
         self.realMap = realMap
+        self.settledNum = 0  # the number of intersections settled by the last search
+        self.landmarks = None  # Landmarks for ALT, computed by the first ALT search
+        self.hierarchy = None  # ContractionHierarchy, built by the first CCH search
+        self.routeCache = RouteCache()
 
-    def navigate(self, car, source, destination):
+    def navigate(self, car, source, destination, algorithm=None):
         """
         Use Dijkstra algorithm and current traffic situation to find the quickest route
         for the given source and destination pair.
+        A* (algorithm = Navigator.ASTAR) searches toward the target with a lower bound of the time from
+        each intersection to the target, so it settles fewer intersections for a route of the same time.
+        ALT (algorithm = Navigator.ALT) is A* with the tighter lower bounds of the landmarks' free-flow times.
+        CCH (algorithm = Navigator.CCH) queries a customizable contraction hierarchy of the map, whose
+        times are updated every CCH_CUSTOMIZE_INTERVAL seconds.
         :param realMap: (RealMap) the map for this navigator
         :param source: (Road) the road that the car is on
         :param destination: (SinkSource)
+        :param algorithm: Navigator.DIJKSTRA, Navigator.ASTAR, Navigator.ALT or Navigator.CCH; None: ROUTING_ALGORITHM in config
         :return: a list of path (roads)
         """
-        # since we currently doesn't use multi-thread for each car, we can use heapq for better performance
+        # the route only depends on these, so it is reused until the travel time epoch advances
+        algorithm = algorithm or ROUTING_ALGORITHM
+        key = (source.getTarget(), destination, algorithm, self.realMap.travelTimes.getEpoch())
+        route = self.routeCache.get(key)
+        if route is not None:
+            self.settledNum = 0
+            return route
+        route = self.findRoute(car, source, destination, algorithm)
+        self.routeCache.put(key, route)
+        return route
+
+    def findRoute(self, car, source, destination, algorithm):
+        """
+        Search the quickest route with the given algorithm; see navigate.
+        """
+        if algorithm == Navigator.CCH:
+            return self.navigateHierarchy(source, destination)
+
+        # since we currently doesn't use multi-thread for each car, we can use heapq for better performance.
+        # A shorter time to an intersection is pushed as a new entry instead of updating the old entry
+        # in the heap (lazy deletion); the old entry is skipped when it is popped after the intersection
+        # is settled. The counter breaks the ties in the order of pushing.
         heap = []
         times = {}    # key: intersection, value: time
         backPtr = {}  # key: intersection, value: intersection
-        routeWeights = {}
+        settled = set()
         sourceInter = source.getTarget()
 
         if destination.isIntersection():
@@ -34,33 +79,34 @@ class Navigator(object):
         else:
             targetInter = destination.getRoad().getSource()
 
-        begin = RouteWeight(0, sourceInter)
-        times[sourceInter] = 0
-        routeWeights[sourceInter] = begin
-        heapq.heappush(heap, begin)
+        lowerBound = self.getLowerBound(targetInter, algorithm)
+
+        # skip the search if the target cannot be reached (it would explore the whole graph)
+        if self.realMap.graph.isReachable(sourceInter, targetInter):
+            times[sourceInter] = 0
+            heap.append((0, 0, sourceInter))
+        pushNum = 1
 
         while heap:
-            curt = heapq.heappop(heap)
+            _, _, curtInter = heapq.heappop(heap)
+            if curtInter in settled:
+                continue
+            settled.add(curtInter)
+            curtTime = times[curtInter]
 
-            if curt.intersection == targetInter:
+            if curtInter == targetInter:
                 break
 
-            neighborData = self.realMap.neighborAndTime(curt.intersection)
+            neighborData = self.realMap.neighborAndTime(curtInter)
             for t, nextInter in neighborData:
-                newTime = min(t + curt.time, Navigator.MAX_TIME)
-                if nextInter in times:
-                    if newTime < times[nextInter]:
-                        key = routeWeights[nextInter]
-                        key.time = newTime
-                        heapq.heapify(heap)
-                        times[nextInter] = newTime
-                        backPtr[nextInter] = curt.intersection
-                else:
-                    backPtr[nextInter] = curt.intersection
+                newTime = min(t + curtTime, Navigator.MAX_TIME)
+                if nextInter not in times or newTime < times[nextInter]:
                     times[nextInter] = newTime
-                    nextRouteWeight = RouteWeight(newTime, nextInter)
-                    routeWeights[nextInter] = nextRouteWeight
-                    heapq.heappush(heap, nextRouteWeight)
+                    backPtr[nextInter] = curtInter
+                    priority = newTime + lowerBound(nextInter) if lowerBound else newTime
+                    heapq.heappush(heap, (priority, pushNum, nextInter))
+                    pushNum += 1
+        self.settledNum = len(settled)
 
         route = self.extractPath(targetInter, backPtr, car)
         if not destination.isIntersection():
@@ -68,6 +114,85 @@ class Navigator(object):
 
         return route
 
+    def navigateHierarchy(self, source, destination):
+        """
+        Find the quickest route with the contraction hierarchy, which is built from the map's topology by
+        the first search and customized with the published traffic times when they are too old.
+        :param source: (Road) the road that the car is on
+        :param destination: (SinkSource)
+        :return: a list of path (roads)
+        """
+        graph = self.realMap.graph
+        if self.hierarchy is None or self.hierarchy.graph is not graph:
+            self.hierarchy = ContractionHierarchy(graph)
+        if self.hierarchy.isStale(self.realMap.travelTimes):
+            self.hierarchy.customize(self.realMap.travelTimes)
+
+        sourceInter = source.getTarget()
+        if destination.isIntersection():
+            targetInter = destination.getIntersection()
+        else:
+            targetInter = destination.getRoad().getSource()
+
+        route = []
+        self.settledNum = 0
+        if graph.isReachable(sourceInter, targetInter):
+            _, edges = self.hierarchy.query(sourceInter.nodeIdx, targetInter.nodeIdx)
+            self.settledNum = self.hierarchy.settledNum
+            route = [graph.edges[edge] for edge in edges or []]
+        if not destination.isIntersection():
+            route.append(destination.getRoad())
+        return route
+
+    def getLowerBound(self, targetInter, algorithm):
+        """
+        :return: a function that gives a lower bound of the time (second) from an intersection to the target
+                 intersection for A*; None for Dijkstra
+        """
+        if algorithm == Navigator.DIJKSTRA:
+            return None
+        if algorithm == Navigator.ALT:
+            return self.getLandmarkBound(targetInter)
+        if algorithm != Navigator.ASTAR:
+            sys.stderr.write("Navigator: unknown routing algorithm: %s" % algorithm)
+            sys.exit(1)
+
+        # no road is faster than its length at the highest speed limit, and the road lengths are the
+        # distances between the intersections, so the straight-line distance gives a consistent bound
+        maxSpeed = self.realMap.travelTimes.getMaxSpeedLimit()
+        if maxSpeed <= 0:
+            return None
+        scale = Traffic.SECOND_PER_HOUR / maxSpeed * Navigator.LOWER_BOUND_SCALE
+        targetCenter = targetInter.center
+        bounds = {}
+
+        def lowerBound(inter):
+            if inter not in bounds:
+                bounds[inter] = haversine(inter.center, targetCenter) * scale
+            return bounds[inter]
+        return lowerBound
+
+    def getLandmarkBound(self, targetInter):
+        """
+        :return: a function that gives the landmarks' lower bound of the time (second) from an intersection
+                 to the target intersection for ALT; None if there is no landmark
+        """
+        travelTimes = self.realMap.travelTimes
+        if self.landmarks is None or self.landmarks.graph is not self.realMap.graph:
+            self.landmarks = Landmarks(self.realMap.graph)
+        if not self.landmarks.isValid(travelTimes):
+            self.landmarks.compute(travelTimes.speedLimits)
+        if not self.landmarks.landmarks:
+            return None
+        landmarkBound = self.landmarks.getLowerBound(targetInter)
+        bounds = {}
+
+        def lowerBound(inter):
+            if inter not in bounds:
+                bounds[inter] = landmarkBound(inter)
+            return bounds[inter]
+        return lowerBound
+
     def extractPath(self, target, backPtr, car):
         """
         Extract the shortest path using the back pointer of each node starting
@@ -80,21 +205,19 @@ class Navigator(object):
         """
         roads = []
         current = target
+        graph = self.realMap.graph
 
         while current and current in backPtr:
             preNode = backPtr[current]
-            found = False
-            for road in preNode.getOutRoads():
-                if road.getTarget() == current:
-                    roads.insert(0, road)
-                    found = True
-                    break
-            if found:
+            road = graph.getRoad(preNode, current)
+            if road is not None:
+                roads.append(road)
                 current = preNode
             else:
-                print "Navigator cannot find a route for %s" % car.id
+                print "Navigator cannot find a route for %s" % car.name
                 return
 
+        roads.reverse()
         return roads
 
 
@@ -4,19 +4,37 @@ from collections import defaultdict
 from shapefileParser import Shapefile
 
 from road import Road
+from road import RoadGeometry
+from roadGraph import RoadGraph
 from car import Car
 from car import Taxi
 from trafficUtil import Traffic
 from trafficUtil import CarType
+from trafficUtil import RoadType
+from trafficUtil import IntervalIndex
 from trafficUtil import sampleOne
 from trajectory import Trajectory
+from vehicleStore import VehicleStore
+from travelTimeSnapshot import TravelTimeSnapshot
 from sinkSource import SinkSource
 from fixedRandom import FixedRandom
 from navigation import Navigator
+from spatialIndex import SpatialGrid
+from mapCache import MapCache
+from tiledMapBuilder import TiledMapBuilder
+from shapefileIndex import MapRegion
 from config import MAJOR_ROAD_MIN_LEN
 from config import CAR_LENGTH
 from config import MIN_SINK_SOURCE_ROAD_LENGTH
 from config import ROAD_OFFSET_FOR_SINK_SOURCE_POINT
+from config import USE_SPATIAL_INDEX
+from config import SPATIAL_GRID_CELL_SIZE
+from config import MAP_BUILD_PROCESSES
+from config import MAP_BUILD_TILES
+from config import USE_MAP_CACHE
+from config import PRUNE_UNREACHABLE_FRAGMENTS
+from config import MAP_CACHE_FOLDER
+from src.settings import RANDOM_SEED
 
 
 class RealMap(object):
@@ -24,7 +42,7 @@ class RealMap(object):
     A class that uses real world road data to construct a map.
     """
 
-    def __init__(self, shapefileName, dataNum):
+    def __init__(self, shapefileName, dataNum, region=None):
         """
         1. Initialize a real map according to a shapefile.
         2. Get the information of road and intersection from the parsed shapefile.
@@ -33,29 +51,35 @@ class RealMap(object):
 
         :param shapefileName: the file name of the given shape file.
         :param dataNum: the number of shape file records to be read.
+        :param region: a bounding box (top, bot, right, left) or a polygon [(lng, lat), ...].
+                       If it is given, only the records in the region are read instead of the
+                       first dataNum records.
         """
-        self.she = Shapefile(shapefileName, dataNum)  # parse shape file
+        region = MapRegion.fromSetting(region)
+        self.she = Shapefile(shapefileName, dataNum, region)  # parse shape file
         self.roads = {}
         self.intersections = {}
         self.navigator = Navigator(self)  # navigator for cars
         self.sink = []                    # the places that can only be sink places for deleting cars
         self.source = []                  # the places that can only be source places for adding cars
         self.majorRoadSinkSource = []     # the sink places on major roads
-        self.createMap()                  # create the map by connecting the intersection and roads
+        self.mapBuildTime = None          # the time (second) for creating or loading the map
+        self.geometry = None              # RoadGeometry of all roads
+        self.graph = None                 # RoadGraph of the intersections and roads
+        self.travelTimes = None           # TravelTimeSnapshot of the roads in the graph
+        self.board = None                 # [top, bot, right, left] of the borders of this map
+        self.mapCache = MapCache(MAP_CACHE_FOLDER, shapefileName, self.she.digest, dataNum, RANDOM_SEED, region) \
+            if USE_MAP_CACHE else None
         self.majorRoads = []
         self.nonMajorRoads = []
-        for road in self.roads.values():
-            if road.isMajorRoad:
-                self.majorRoads.append(road)
-            else:
-                self.nonMajorRoads.append(road)
+        self.loadMap()                    # create the map by connecting the intersection and roads
 
-        self.board = self.she.getBoard()  # [top, bot, right, left] of the borders of this map
         self.goalLocation = None          # the car crash's location
         self.cars = {}                    # store all cars' id and instance
         self.taxis = {}                   # store all taxis' id and instance
         self.reset = False                # indicate whether it is in the middle (reset) of experiments
-        self.locDict = defaultdict(list)  # recode which car is on which lane
+        self.locDict = defaultdict(IntervalIndex)  # recode which car is on which lane
+        self.vehicleStore = VehicleStore()        # the state of all cars and taxis
         self.aniMapPlotOK = False         # indicate the map has been plotted
 
     def getRoads(self):
@@ -97,13 +121,8 @@ class RealMap(object):
         :param target: intersection
         :return: a list of roads
         """
-        roads = []
-        for road in source.getOutRoads() + target.getOutRoads():
-            if road.getTarget() == target and road.getSource() == source:
-                roads.append(road)
-            elif road.getSource() == target and road.getTarget() == source:
-                roads.append(road)
-        return roads
+        roads = [self.graph.getRoad(source, target), self.graph.getRoad(target, source)]
+        return [road for road in roads if road is not None]
 
     def getCars(self):
         return self.cars
@@ -113,7 +132,7 @@ class RealMap(object):
 
     def setResetFlag(self, b):
         self.reset = b
-        self.locDict = defaultdict(list)
+        self.locDict = defaultdict(IntervalIndex)
 
     def setAniMapPlotOk(self, b):
         self.aniMapPlotOK = b
@@ -142,16 +161,88 @@ class RealMap(object):
         else:
             return targetInter.getOutRoads()
 
+    def loadMap(self):
+        """
+        Load the compiled map of this shapefile, MAP_SIZE and RANDOM_SEED if it exists.
+        Otherwise, create the map and compile it for the next run.
+        """
+        if self.mapCache and self.mapCache.exists():
+            start_time = time.time()
+            if self.mapCache.load(self):
+                self.mapBuildTime = time.time() - start_time
+                print "total road:", len(self.roads), "; total intersection:", len(self.intersections)
+                print "Loading compiled map using", self.mapBuildTime, "seconds"
+                return
+        self.createMap()
+        self.splitMajorRoads(self.roads.values())
+        if self.mapCache:
+            self.mapCache.save(self)
+
+    def splitMajorRoads(self, roads):
+        """
+        Put the given roads into the major and non-major road lists for picking random roads. With
+        PRUNE_UNREACHABLE_FRAGMENTS, the roads outside the component chosen by pruneSinkSource are left out.
+        :param roads: a list of roads. Its order is kept for picking random roads.
+        """
+        self.majorRoads = []
+        self.nonMajorRoads = []
+        for road in roads:
+            if PRUNE_UNREACHABLE_FRAGMENTS and not (road.getSource() and road.getTarget() and
+                                                    self.graph.isRoadInGiantComponent(road)):
+                continue
+            if road.isMajorRoad:
+                self.majorRoads.append(road)
+            else:
+                self.nonMajorRoads.append(road)
+
+    def compileMap(self, folder=MAP_CACHE_FOLDER):
+        """
+        Write the created map to a compiled map file.
+        :param folder: the folder for the compiled map file
+        :return: the compiled map's file name
+        """
+        mapCache = MapCache(folder, self.she.filename, self.she.digest, self.she.dataNum, RANDOM_SEED,
+                            self.she.region)
+        mapCache.save(self)
+        return mapCache.filename
+
     def createMap(self):
         """
         Connect intersections with roads. Assume every road has two directions.
         """
         print "Creating map"
 
-        i = 0
         start_time = time.time()  # for computing the execution time
+        if MAP_BUILD_PROCESSES > 1:
+            self.createTiledMap(MAP_BUILD_PROCESSES, MAP_BUILD_TILES)
+        elif USE_SPATIAL_INDEX:
+            self.createS2Map()
+        else:
+            self.connectAllRoads()
+
+        print ""
+        print "total road:", len(self.roads), "; total intersection:", len(self.intersections)
+
+        self.buildGeometry()
+        self.buildTrafficLight()
+        self.createSinkSourcePlace()
+        self.examineMap()
+        self.buildGraph()
+        if PRUNE_UNREACHABLE_FRAGMENTS:
+            self.pruneSinkSource()
+        self.board = self.she.getBoard()
+
+        self.mapBuildTime = time.time() - start_time
+        print "Using", self.mapBuildTime, "seconds"
+
+    def connectAllRoads(self):
+        """
+        Check every road against every intersection. This is O(intersections x roads).
+        """
+        i = 0
+        roads = self.she.getRoads().values()
         for inter in self.she.getIntersections().values():
-            for rd in self.she.getRoads().values():
+            for rd in roads:
                 # =========================
                 # showing progress
                 i += 1
@@ -160,48 +251,165 @@ class RealMap(object):
                     if i % 50000000 == 0:
                         print ""
                 # =========================
+                self.connect(rd, inter)
+            self.addIntersection(inter)
+
+    def createS2Map(self):
+        """
+        Create the map by bucketing the roads' bounding boxes into a uniform grid (a simplified
+        version of the Google S2 idea). Each intersection is only checked against the roads whose
+        bounding boxes cover the same grid cells as its corners, so the map creation is near-linear
+        in the number of records. The roads are checked in the same order as connectAllRoads(),
+        so both methods build the same map.
+        (https://docs.google.com/presentation/d/1Hl4KapfAENAOf4gv-pSngKwvS_jwNVHRPZTTDzXXn6Q/view?pli=1#slide=id.i95)
+        """
+        grid = SpatialGrid.fromRoads(self.she.getRoads().values(), SPATIAL_GRID_CELL_SIZE)
+        for inter in self.she.getIntersections().values():
+            for rd in grid.queryPoints(inter.corners):
+                self.connect(rd, inter)
+            self.addIntersection(inter)
+
+    def createTiledMap(self, processes, tileNum=None):
+        """
+        Find the connections between intersections and roads tile by tile in a pool of processes
+        (see TiledMapBuilder), then stitch them into one map. The connections are applied in the
+        same order as createS2Map(), so the map and the ids of its objects are the same.
+        :param processes: (int) the number of processes
+        :param tileNum: (int) the number of tiles
+        """
+        builder = TiledMapBuilder(self.she.getColumns(RoadType.INTERSECTION), self.she.getColumns(RoadType.ROAD),
+                                  processes, tileNum)
+        interRecords = self.she.getRecordObjects(RoadType.INTERSECTION)
+        roadRecords = self.she.getRecordObjects(RoadType.ROAD)
+        connections = defaultdict(list)
+        for i, j in builder.findConnections().tolist():
+            connections[interRecords[i].id].append(roadRecords[j])
+
+        roadOrder = dict((rd.id, i) for i, rd in enumerate(self.she.getRoads().values()))
+        for inter in self.she.getIntersections().values():
+            for rd in sorted(connections[inter.id], key=lambda x: roadOrder[x.id]):
+                self.linkRoad(rd, inter)
+            self.addIntersection(inter)
 
-                if rd.isConnected(inter):
-                    if not rd.getSource():
-                        rd.setSource(inter)  # TODO: reduce some distance for intersection?
-                    elif not rd.getTarget():
-                        rd.setTarget(inter)
-                        inter.addInRoad(rd)
-                        self.roads[rd.id] = rd
-                        sourceInter = rd.getSource()
-                        sourceInter.addOutRoad(rd)
-
-                        # add a road for opposite direction
-                        opRd = Road(rd.corners, rd.center, rd.getTarget(), rd.getSource())
-                        inter.addOutRoad(opRd)
-                        sourceInter.addInRoad(opRd)
-                        self.roads[opRd.id] = opRd
-                        if sourceInter.getOutRoads() and sourceInter.getInRoads() and sourceInter.id not in self.intersections:
-                            self.intersections[sourceInter.id] = sourceInter
-
-            if inter.getOutRoads() and inter.getInRoads():
-                if len(inter.getOutRoads()) != len(inter.getInRoads()):
-                    print "intersection has different number of out and in roads"
-                    continue
-                self.intersections[inter.id] = inter
+    def connect(self, rd, inter):
+        """
+        If the road is connected to the intersection, link them (see linkRoad).
+        :param rd: Road object from the shapefile
+        :param inter: Intersection object from the shapefile
+        """
+        if rd.isConnected(inter):
+            self.linkRoad(rd, inter)
 
-        print ""
-        print "total road:", len(self.roads), "; total intersection:", len(self.intersections)
+    def linkRoad(self, rd, inter):
+        """
+        Set the intersection as the road's source or target. When both ends are set,
+        also add the road for the opposite direction.
+        :param rd: Road object from the shapefile
+        :param inter: Intersection object that is connected to the road
+        """
+        if not rd.getSource():
+            rd.setSource(inter)  # TODO: reduce some distance for intersection?
+        elif not rd.getTarget():
+            rd.setTarget(inter)
+            inter.addInRoad(rd)
+            self.roads[rd.id] = rd
+            sourceInter = rd.getSource()
+            sourceInter.addOutRoad(rd)
 
-        self.buildTrafficLight()
-        self.createSinkSourcePlace()
-        self.examineMap()
+            # add a road for opposite direction
+            opRd = Road(rd.corners, rd.center, rd.getTarget(), rd.getSource(), deferLength=True)
+            inter.addOutRoad(opRd)
+            sourceInter.addInRoad(opRd)
+            self.roads[opRd.id] = opRd
+            if sourceInter.getOutRoads() and sourceInter.getInRoads() and sourceInter.id not in self.intersections:
+                self.intersections[sourceInter.id] = sourceInter
+
+    def addIntersection(self, inter):
+        """
+        Add the intersection to the map if it has been connected to roads.
+        """
+        if inter.getOutRoads() and inter.getInRoads():
+            if len(inter.getOutRoads()) != len(inter.getInRoads()):
+                print "intersection has different number of out and in roads"
+                return
+            self.intersections[inter.id] = inter
 
-        print "Using", (time.time() - start_time), "seconds"
+    def buildGeometry(self):
+        """
+        Compute the lengths of all roads and the coordinates of their lanes in one batch.
+        """
+        roads = [rd for rd in self.roads.values() if rd.getSource() and rd.getTarget()]
+        if roads:
+            self.geometry = RoadGeometry(roads)
 
+    def buildGraph(self):
+        """
+        Build the integer-indexed graph of the intersections and roads for O(1) lookups.
+        """
+        self.graph = RoadGraph(self.intersections.values(), self.roads.values())
+        self.travelTimes = TravelTimeSnapshot(self.graph)
 
-    def createS2Map(self):
+    def pruneSinkSource(self):
         """
-        Create the map by utilizing the Google S2 algorithm. This can speed up the map creation process.
-        (https://docs.google.com/presentation/d/1Hl4KapfAENAOf4gv-pSngKwvS_jwNVHRPZTTDzXXn6Q/view?pli=1#slide=id.i95)
-        :return:
+        Only keep the sink and source places in one strongly connected component of the map, so every
+        car can reach its destination from where it is added. It is the largest component, unless that
+        one has no sink or no source; then it is the component with the most sinks and sources.
         """
-        pass
+        graph = self.graph
+        sinkNum, sourceNum = defaultdict(int), defaultdict(int)
+        for point in self.sink:
+            sinkNum[self.componentOf(point)] += 1
+        for point in self.source:
+            sourceNum[self.componentOf(point)] += 1
+        candidates = [comp for comp in sinkNum if comp >= 0 and sourceNum[comp]]
+        if not candidates:
+            sys.stderr.write("RealMap: no strongly connected component has both a sink and a source\n")
+            sys.exit(1)
+        if graph.giantComponent not in candidates:
+            graph.giantComponent = max(candidates, key=lambda comp: (sinkNum[comp] + sourceNum[comp],
+                                                                     graph.componentSizes[comp]))
+            print "The largest component has no sink or no source; using a component of %d intersections" % \
+                  graph.componentSizes[graph.giantComponent]
+
+        def reachable(point):
+            return self.componentOf(point) == graph.giantComponent
+
+        totalSink, totalSource = len(self.sink), len(self.source)
+        self.sink = [point for point in self.sink if reachable(point)]
+        self.source = [point for point in self.source if reachable(point)]
+        self.majorRoadSinkSource = [point for point in self.majorRoadSinkSource if reachable(point)]
+        print "%d strongly connected components; the largest has %d of %d intersections" % \
+              (graph.componentNum(), graph.componentSizes.max(), graph.nodeNum())
+        print "%d sinks and %d sources are not in the component the cars drive in" % \
+              (totalSink - len(self.sink), totalSource - len(self.source))
+
+    def componentOf(self, point):
+        """
+        :param point: (SinkSource)
+        :return: the strongly connected component of the place; -1 if it is a road between two components
+        """
+        graph = self.graph
+        if point.isIntersection():
+            inter = point.getIntersection()
+            return int(graph.component[inter.nodeIdx]) if graph.hasNode(inter) else -1
+        road = point.getRoad()
+        if not (road.getSource() and road.getTarget() and graph.hasNode(road.getSource()) and
+                graph.hasNode(road.getTarget())):
+            return -1
+        comp = int(graph.component[road.getSource().nodeIdx])
+        return comp if comp == graph.component[road.getTarget().nodeIdx] else -1
+
+    def isReachable(self, road, destination):
+        """
+        :param road: (Road) the road that the car is on
+        :param destination: (SinkSource)
+        :return: True if the car on the road can reach the destination
+        """
+        if destination.isIntersection():
+            targetInter = destination.getIntersection()
+        else:
+            targetInter = destination.getRoad().getSource()
+        return self.graph.isReachable(road.getTarget(), targetInter)
 
     def buildTrafficLight(self):
         """
@@ -239,7 +447,7 @@ class RealMap(object):
         del removeInters
         del removeRoads
 
-        allInter = [inter.id for inter in self.intersections.values()]
+        allInter = set(self.intersections)
         for road in self.roads.values():
             if road.target.id not in allInter:
                 print "Err: target intersection not found"
@@ -341,6 +549,9 @@ class RealMap(object):
             roads = self.majorRoads
         else:
             roads = self.nonMajorRoads
+        if not roads:
+            sys.stderr.write("RealMap: no %s road to add cars to" % ("major" if onMajorRoad else "non-major"))
+            sys.exit(1)
 
         road = None
         while road is None:
@@ -413,11 +624,7 @@ class RealMap(object):
                 for i in range(2 * numCar):  # try twice of the number of new cars since some picked lanes are filled with cars
                     road = sampleOne(inter.getOutRoads())
                     lane = sampleOne(road.getLanes())
-                    addCar = True
-                    for car in lane.getCars():
-                        if car.trajectory.getAbsolutePosition() < CAR_LENGTH:
-                            addCar = False
-                            break
+                    addCar = not lane.hasCarBetween(None, CAR_LENGTH)
                     if addCar:
                         addedCar += 1
                         destination = sampleOne(self.sink)
@@ -430,12 +637,8 @@ class RealMap(object):
                 road, pos = s.getRoadPos()
                 absolutePos = pos * road.getLength()
                 for lane in road.getLanes()[::-1]:  # when a car goes into the road, it probably is on the right-most lane
-                    addCar = True
-                    for car in lane.getCars():
-                        if absolutePos - CAR_LENGTH < car.trajectory.getAbsolutePosition() < absolutePos + CAR_LENGTH:
-                            # print "front car is too close to the new car"
-                            addCar = False
-                            break
+                    # the front or rear car is too close to the new car
+                    addCar = not lane.hasCarBetween(absolutePos - CAR_LENGTH, absolutePos + CAR_LENGTH)
                     if addCar:
                         addedCar += 1
                         destination = sampleOne(self.sink)
@@ -476,16 +679,16 @@ class RealMap(object):
     def checkOverlap(self, lane, position, carLength):
         """
         Check whether the picked position for a car is overlapped with existing cars.
-        :param locDict: the dictionary records all the cars' position on each lane
+        The picked positions on each lane are kept in self.locDict as an IntervalIndex.
         :param lane: the given lane to check
         :param position: the given position to check
         :return: True if the car is not overlapped with existing cars; False otherwise
         """
         half = carLength / lane.getLength()
-        for start, end in self.locDict[lane]:
-            if start <= position + half <= end or start <= position - half <= end:
-                return False
-        self.locDict[lane].append((position - half, position + half))
+        picked = self.locDict[lane]
+        if picked.containsPoint(position + half) or picked.containsPoint(position - half):
+            return False
+        picked.add(position - half, position + half)
         return True
 
     def checkReset(self):
@@ -510,11 +713,8 @@ class RealMap(object):
         :param intersection: (Intersection)
         :return: a list of tuple (time, neighbor intersection)
         """
-        nbs = []
-        for road in intersection.getOutRoads():
-            time = road.getAvgTrafficTime()
-            nbs.append((time, road.getTarget()))
-        return nbs
+        times = self.travelTimes.getTimes()
+        return [(times[road.edgeIdx], road.getTarget()) for road in intersection.getOutRoads()]
 
     def neighborAndDistance(self, intersection):
         """
@@ -536,26 +736,17 @@ class RealMap(object):
         :param targetIntersection:
         :return: return the traffic time (second)
         """
-        road = None
-        for rd in sourceIntersection.getOutRoads():
-            if rd.getTarget().id == targetIntersection.id:
-                road = rd
-                break
+        road = self.graph.getRoad(sourceIntersection, targetIntersection)
         curAvgSpd = road.getCurAvgSpeed()
         if curAvgSpd > 0:
             return (road.getLength() / curAvgSpd) * Traffic.SECOND_PER_HOUR  # convert to second
         else:
             return sys.maxint
 
-    @classmethod
-    def getOppositeRoad(cls, road):
+    def getOppositeRoad(self, road):
         """
         Find the road with opposite direction of the given road
         :param road: the given road
         :return: the road with opposite direction
         """
-        source = road.getSource()
-        target = road.getTarget()
-        for rd in target.getOutRoads():
-            if rd.getTarget.id == source.id:
-                return rd
+        return self.graph.getOppositeRoad(road)
@@ -1,17 +1,23 @@
 from __future__ import division
 import sys
 import os
+from collections import deque
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 import numpy as np
 
 from lane import Lane
+from lane import LANE_WIDTH
+from lane import SPEED_SCALE
 from trafficUtil import Traffic
+from trafficUtil import CarType
 from trafficUtil import RoadType
 from drawUtil import calcVectAngle
 from drawUtil import haversine
+from drawUtil import haversineArray
 from config import MAX_ROAD_LANE_NUM
 from config import MAJOR_ROAD_MIN_LEN
 from config import AVG_TIME_PERIOD
+from config import DRIVE_TIME_HISTORY_SIZE
 
 
 class Road(object):
@@ -19,7 +25,7 @@ class Road(object):
     A class that represents a road. It will connect to intersections and contain lanes.
     """
 
-    def __init__(self, corners, center, source, target, speed=40):
+    def __init__(self, corners, center, source, target, speed=40, deferLength=False):
         """
         Create a road that start form the source intersection to the destination intersection.
         :param corners: the four points of the road from the shapefile
@@ -27,6 +33,7 @@ class Road(object):
         :param source: the source intersection
         :param target: the target intersection
         :param speed: the average speed of this road
+        :param deferLength: leave the length (and whether it is a major road) to RoadGeometry
         """
         self.corners = corners
         self.center = center
@@ -36,17 +43,24 @@ class Road(object):
         self.top, self.bottom, self.right, self.left = self.parseCorners(corners)
         self.speedLimit = speed
         self.avgSpeed = 0
-        self.recentSpeedList = []
         self.id = Traffic.uniqueId(RoadType.ROAD)
         self.lanes = []
         self.lanesNumber = None
+        self.storeIdx = None  # the index of this road in the VehicleStore
+        self.carNum = 0       # the number of cars on this road
+        self.speedSum = 0     # the sum of their scaled speeds (see Lane.scaleSpeed)
+        self.members = {CarType.CAR: set(), CarType.TAXI: set()}  # the cars on this road by their type
         self.length = None
-        self.setLength()
+        if not deferLength:
+            self.setLength()
         self.targetSide = None
         self.sourceSide = None
         self.targetSideId = 0
         self.sourceSideId = 0
-        self.isMajorRoad = self.length >= MAJOR_ROAD_MIN_LEN
+        self.isMajorRoad = None if deferLength else self.length >= MAJOR_ROAD_MIN_LEN
+        self.geometryIdx = None  # the index of this road in RoadGeometry
+        self.edgeIdx = None      # the edge id in RoadGraph
+        self.oppositeRoad = None  # the road of the opposite direction, set by RoadGraph
         self.update()
 
         # data structure for calculate the average speed
@@ -74,12 +88,33 @@ class Road(object):
         minLnt = min(lnts)
         return maxLat, minLat, maxLnt, minLnt
 
-    def getCars(self):
-        carPosition = []
-        for lane in self.lanes:
-            carPosition.extend(lane.carsPosition.values())
-        cars = [cp.car for cp in carPosition if cp.car is not None]
-        return cars
+    def addCar(self, car, speed):
+        """
+        Count the car that enters this road. Changing lanes on this road does not count.
+        """
+        self.carNum += 1
+        self.speedSum += Lane.scaleSpeed(speed)
+        self.members[car.vehicleType].add(car)
+
+    def removeCar(self, car, speed):
+        """
+        Stop counting the car that leaves this road.
+        """
+        self.carNum -= 1
+        self.speedSum -= Lane.scaleSpeed(speed)
+        self.members[car.vehicleType].discard(car)
+
+    def getCars(self, carType=None):
+        """
+        :param carType: CarType.CAR or CarType.TAXI; None: all cars
+        :return: the set of the cars of the given type on this road (do not modify it), or a list of all cars
+        """
+        if carType is not None:
+            return self.members[carType]
+        return list(self.members[CarType.CAR]) + list(self.members[CarType.TAXI])
+
+    def getCarNum(self):
+        return self.carNum
 
     def getAvgTrafficTime(self):
         avgDriveTime = self.roadSpeed.getAvgDriveTime(Traffic.globalTime)
@@ -97,13 +132,8 @@ class Road(object):
         the default speed of this road.
         :return: the average speed (km/h)
         """
-        # carPosition = []
-        # for lane in self.lanes:
-        #     carPosition.extend(lane.carsPosition.values())
-        # cars = [cp.car for cp in carPosition if cp.car is not None]
-        cars = self.getCars()
-        if len(cars) > 0:
-            return min(self.speedLimit, sum([car.speed for car in cars]) / len(cars))
+        if self.carNum > 0:
+            return min(self.speedLimit, self.speedSum / self.carNum / SPEED_SCALE)
         else:
             return self.speedLimit
 
@@ -153,7 +183,7 @@ class Road(object):
         :param source: Intersection object
         """
         self.source = source
-        self.setLength()
+        self.length = None  # computed by RoadGeometry or when it is needed
         self.update()
 
     def setTarget(self, target):
@@ -162,7 +192,7 @@ class Road(object):
         :param target: Intersection object
         """
         self.target = target
-        self.setLength()
+        self.length = None  # computed by RoadGeometry or when it is needed
         self.update()
 
     def getSource(self):
@@ -179,6 +209,21 @@ class Road(object):
     def getLanes(self):
         return self.lanes
 
+    def setGeometry(self, geometry, idx):
+        """
+        Read the length of this road and the shifted coordinates of its lanes from a RoadGeometry.
+        :param geometry: RoadGeometry object
+        :param idx: the index of this road in the geometry's arrays
+        """
+        self.geometryIdx = idx
+        self.length = geometry.lengths[idx]
+        if self.isMajorRoad is None:
+            self.isMajorRoad = self.length >= MAJOR_ROAD_MIN_LEN
+        for i, lane in enumerate(self.lanes):
+            sourceLng, sourceLat = geometry.shiftSources[idx][i]
+            targetLng, targetLat = geometry.shiftTargets[idx][i]
+            lane.setShift(sourceLng, sourceLat, targetLng, targetLat)
+
     def getFastLaneBeforePos(self, pos):
         return reduce(lambda a, b: a if a[1] > b[1] else b,
                       [(lane, lane.getFrontAvgSpeed(pos)) for lane in self.lanes])
@@ -250,16 +295,74 @@ class Road(object):
         self.roadSpeed.updateCarDriveTime(carId, pos)
 
 
+class RoadGeometry(object):
+    """
+    The geometry of all roads computed with NumPy in one batch when the map is built:
+    the road lengths, direction vectors and unit vectors, and the shifted source and
+    target coordinates of each lane.
+    """
+
+    def __init__(self, roads):
+        """
+        :param roads: a list of roads that have source and target intersections
+        """
+        self.roads = roads
+        sources = np.array([rd.getSource().center.getCoords() for rd in roads], dtype=np.float64).reshape(-1, 2)
+        targets = np.array([rd.getTarget().center.getCoords() for rd in roads], dtype=np.float64).reshape(-1, 2)
+        laneNum = max([len(rd.getLanes()) for rd in roads] + [MAX_ROAD_LANE_NUM])
+
+        self.lengthArray = haversineArray(sources, targets)
+        self.vectors = targets - sources
+        norms = np.hypot(self.vectors[:, 0], self.vectors[:, 1])
+        self.unitVectors = self.vectors / np.where(norms > 0, norms, 1)[:, np.newaxis]
+
+        # the left-most lane shifts 0.5 * LANE_WIDTH, the second left-most lane shifts 1.5 * LANE_WIDTH, ...
+        self.laneShifts = Lane.shiftArray(self.vectors, LANE_WIDTH * (np.arange(laneNum) + 0.5))
+        self.shiftSourceArray = sources[:, np.newaxis, :] + self.laneShifts
+        self.shiftTargetArray = targets[:, np.newaxis, :] + self.laneShifts
+
+        # Python lists for the roads and lanes to read without creating NumPy scalars
+        self.lengths = self.lengthArray.tolist()
+        self.shiftSources = self.shiftSourceArray.tolist()
+        self.shiftTargets = self.shiftTargetArray.tolist()
+
+        for i, rd in enumerate(roads):
+            rd.setGeometry(self, i)
+
+
 class RoadSpeed(object):
     """
     The class used to calculate average speed a road within certain time period.
+    The average is kept by running sums, so getAvgDriveTime is amortized O(1):
+    - the end and traffic times of the finished DriveTimes are kept in a DriveTimeHistory in the order
+      of their end times, so the expired ones are popped from the front, with the sum of the traffic
+      times. The history has at most DRIVE_TIME_HISTORY_SIZE records, so a busy road drops its oldest
+      records before they expire;
+    - a driving car's traffic time is (curtTime - startTime) / posDiff, so the sum over the driving cars
+      is curtTime * sum(1 / posDiff) - sum(startTime / posDiff). The cars that have not moved on
+      this road (posDiff == 0) are computed one by one.
+    The sums are recomputed from the records after every few updates (when the average is asked), so
+    rounding errors do not pile up.
     """
 
+    REBUILD_SLACK = 16  # the sums are recomputed after 2 * (number of records) + REBUILD_SLACK updates
+
     def __init__(self, road):
         self.road = road
-        self.driveTimes = []
-        self.cars = {}
-        self.crashedCar = []
+        self.cars = {}           # carId -> the DriveTime of the car on this road
+        self.driving = set()     # the DriveTimes that have not ended (and are not crashed)
+        self.stalled = set()     # the DriveTimes whose traffic time is computed one by one (see countDriving)
+        self.movingNum = 0       # the number of the other driving DriveTimes
+        self.invPosSum = 0.0     # sum(1 / posDiff) of the moving DriveTimes
+        self.startPosSum = 0.0   # sum(startTime / posDiff) of the moving DriveTimes
+        self.drivingUpdates = 0
+        self.history = DriveTimeHistory(DRIVE_TIME_HISTORY_SIZE)  # the finished DriveTimes within AVG_TIME_PERIOD
+        self.zeroEnded = deque()  # the DriveTimes in the history that ended at time 0 (see addFinished)
+        self.finishedNum = 0      # the number of the finished DriveTimes in the history that have a traffic time
+        self.finishedSum = 0.0    # the sum of their traffic times
+        self.finishedUpdates = 0
+        self.droppedNum = 0       # the number of the finished DriveTimes dropped before they expired
+        self.crashedNum = 0
 
     def addCarDriveTime(self, carId, curtTime, pos):
         """
@@ -269,7 +372,8 @@ class RoadSpeed(object):
         :param pos: (float) relative position
         """
         driveTime = DriveTime(curtTime, pos, carId)
-        self.driveTimes.append(driveTime)
+        self.driving.add(driveTime)
+        self.countDriving(driveTime, 1)
         self.cars[carId] = driveTime
 
     def deleteCarDriveTime(self, carId, curtTime, endPos):
@@ -280,15 +384,104 @@ class RoadSpeed(object):
         """
         if carId in self.cars:
             driveTime = self.cars[carId]
-            driveTime.endTime = curtTime
-            driveTime.endPos = min(endPos, 1)  # because we are using 0~1 to represent the relative position
+            if driveTime in self.driving:
+                self.driving.remove(driveTime)
+                self.countDriving(driveTime, -1)
+                driveTime.endTime = curtTime
+                driveTime.endPos = min(endPos, 1)  # because we are using 0~1 to represent the relative position
+                self.addFinished(driveTime)
+            else:
+                driveTime.endTime = curtTime
+                driveTime.endPos = min(endPos, 1)
             del self.cars[carId]
 
     def updateCarDriveTime(self, carId, pos):
         if carId not in self.cars:
             print "no %s in this road" % carId
             return
-        self.cars[carId].curtPos = min(pos, 1)
+        driveTime = self.cars[carId]
+        if driveTime in self.driving:
+            self.countDriving(driveTime, -1)
+            driveTime.curtPos = min(pos, 1)
+            self.countDriving(driveTime, 1)
+        else:
+            driveTime.curtPos = min(pos, 1)
+
+    def countDriving(self, driveTime, sign):
+        """
+        Add (sign = 1) or remove (sign = -1) a driving DriveTime from the sums.
+        """
+        posDiff = driveTime.curtPos - driveTime.startingPos
+        if posDiff == 0:
+            if sign > 0:
+                self.stalled.add(driveTime)
+            else:
+                self.stalled.discard(driveTime)
+            return
+        self.movingNum += sign
+        self.invPosSum += sign / posDiff
+        self.startPosSum += sign * driveTime.startTime / posDiff
+        self.drivingUpdates += 1
+
+    def rebuildDriving(self):
+        self.movingNum = 0
+        self.invPosSum = 0.0
+        self.startPosSum = 0.0
+        self.drivingUpdates = 0
+        for driveTime in self.driving:
+            posDiff = driveTime.curtPos - driveTime.startingPos
+            if posDiff != 0:
+                self.movingNum += 1
+                self.invPosSum += 1 / posDiff
+                self.startPosSum += driveTime.startTime / posDiff
+
+    def addFinished(self, driveTime):
+        """
+        Add a finished DriveTime to the history. If the history is full, drop its oldest record first.
+        A record that covers no distance or no time (e.g. the next lane position of a car that is
+        released at the intersection it was acquired at) has no traffic time, so it is not kept.
+        """
+        if driveTime.endTime and (driveTime.endPos == driveTime.startingPos or
+                                  driveTime.endTime == driveTime.startTime):
+            return
+        if self.history.isFull():
+            self.removeOldestFinished()
+            self.droppedNum += 1
+        if driveTime.endTime:
+            trafficTime = driveTime.getTrafficTime(driveTime.endTime)
+        else:
+            # DriveTime.getTrafficTime still computes the time of a DriveTime that ended at time 0 (e.g. a car
+            # removed while being placed) as if it was driving, so it is computed one by one
+            trafficTime = None
+            self.stalled.add(driveTime)
+            self.zeroEnded.append(driveTime)
+        self.history.push(driveTime.endTime, trafficTime)
+        if trafficTime is not None:
+            self.finishedNum += 1
+            self.finishedSum += trafficTime
+        self.finishedUpdates += 1
+
+    def removeOldestFinished(self):
+        endTime = self.history.oldestEndTime()
+        trafficTime = self.history.pop()
+        if not endTime:
+            self.stalled.discard(self.zeroEnded.popleft())
+        elif trafficTime is not None:
+            self.finishedNum -= 1
+            self.finishedSum -= trafficTime
+        self.finishedUpdates += 1
+
+    def rebuildFinished(self):
+        times = self.history.getTrafficTimes()
+        self.finishedNum = len(times)
+        self.finishedSum = sum(times)
+        self.finishedUpdates = 0
+
+    def isExpired(self, endTime, curtTime):
+        # since the time will re-start from 0 when it reach the limit, check the current time is >= or < the drive time
+        if curtTime >= endTime:
+            return curtTime - endTime > AVG_TIME_PERIOD
+        return Traffic.globalTimeLimit - (endTime - curtTime) > AVG_TIME_PERIOD
 
     def getAvgDriveTime(self, curtTime):
         """
@@ -298,38 +491,118 @@ class RoadSpeed(object):
         :return: average traffic time in second
         """
         # pop those drive time that end more than AVG_TIME_PERIOD ago
-        # since the time will re-start from 0 when it reach the limit, check the current time is >= or < the drive time
-        expiredDriveTime = []
-        for driveTime in self.driveTimes:
-            if driveTime.endTime is None:
-                continue
-            if curtTime >= driveTime.endTime and curtTime - driveTime.endTime > AVG_TIME_PERIOD:
-                expiredDriveTime.append(driveTime)
-            elif curtTime < driveTime.endTime and Traffic.globalTimeLimit - (driveTime.endTime - curtTime) > AVG_TIME_PERIOD:
-                expiredDriveTime.append(driveTime)
-
-        # delete expired DriveTime
-        for driveTime in expiredDriveTime:
-            self.driveTimes.remove(driveTime)
-
-        times = [x.getTrafficTime(curtTime) for x in self.driveTimes]
-        times = [x for x in times if x is not None]
+        while self.history and self.isExpired(self.history.oldestEndTime(), curtTime):
+            self.removeOldestFinished()
+        if self.finishedUpdates > 2 * len(self.history) + RoadSpeed.REBUILD_SLACK:
+            self.rebuildFinished()
+        if self.drivingUpdates > 2 * len(self.driving) + RoadSpeed.REBUILD_SLACK:
+            self.rebuildDriving()
+
+        # the global time never reaches globalTimeLimit (the float maximum), so curtTime >= startTime
+        totalTime = self.finishedSum + curtTime * self.invPosSum - self.startPosSum
+        timeNum = self.finishedNum + self.movingNum
+        for driveTime in self.stalled:
+            trafficTime = driveTime.getTrafficTime(curtTime)
+            if trafficTime is not None:
+                totalTime += trafficTime
+                timeNum += 1
+
         minTrafficTime = (self.road.getLength() / self.road.speedLimit) * Traffic.SECOND_PER_HOUR
-        if times:
-            avgTime = sum(times) / len(times)
+        if timeNum:
+            avgTime = totalTime / timeNum
             return max(avgTime, minTrafficTime)
         else:
             return minTrafficTime
 
     def setCrash(self, carId):
         driveTime = self.cars[carId]
-        self.driveTimes.remove(driveTime)
-        self.crashedCar.append(driveTime)
+        self.driving.remove(driveTime)
+        self.countDriving(driveTime, -1)
+        self.crashedNum += 1
         driveTime.crash = True
 
+    def memorySize(self):
+        """
+        :return: the memory (bytes) of the drive time records of this road
+        """
+        return self.history.nbytes() + sys.getsizeof(self.history) + \
+            sys.getsizeof(self.cars) + sys.getsizeof(self.driving) + sys.getsizeof(self.stalled) + \
+            sys.getsizeof(self.zeroEnded) + sum(sys.getsizeof(driveTime) for driveTime in self.driving)
+
+
+class DriveTimeHistory(object):
+    """
+    A ring buffer of the end times and traffic times of the finished DriveTimes of a road, oldest first.
+    The arrays start small and double until they hold maxSize records.
+    """
+
+    INITIAL_SIZE = 4
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.endTimes = np.zeros(0)
+        self.trafficTimes = np.zeros(0)  # NaN: the DriveTime has no traffic time
+        self.head = 0  # the index of the oldest record
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def isFull(self):
+        return self.size >= self.maxSize
+
+    def indices(self):
+        return (self.head + np.arange(self.size)) % max(len(self.endTimes), 1)
+
+    def grow(self):
+        capacity = min(max(2 * len(self.endTimes), DriveTimeHistory.INITIAL_SIZE), self.maxSize)
+        endTimes = np.zeros(capacity)
+        trafficTimes = np.zeros(capacity)
+        endTimes[:self.size] = self.endTimes[self.indices()]
+        trafficTimes[:self.size] = self.trafficTimes[self.indices()]
+        self.endTimes, self.trafficTimes = endTimes, trafficTimes
+        self.head = 0
+
+    def push(self, endTime, trafficTime):
+        """
+        Add the newest record. The history must not be full.
+        :param trafficTime: (float) or None
+        """
+        if self.size == len(self.endTimes):
+            self.grow()
+        idx = (self.head + self.size) % len(self.endTimes)
+        self.endTimes.itemset(idx, endTime)
+        self.trafficTimes.itemset(idx, np.nan if trafficTime is None else trafficTime)
+        self.size += 1
+
+    def oldestEndTime(self):
+        return self.endTimes.item(self.head)
+
+    def pop(self):
+        """
+        Remove the oldest record.
+        :return: its traffic time or None
+        """
+        trafficTime = self.trafficTimes.item(self.head)
+        self.head = (self.head + 1) % len(self.endTimes)
+        self.size -= 1
+        return trafficTime if trafficTime == trafficTime else None  # NaN != NaN
+
+    def getTrafficTimes(self):
+        """
+        :return: a list of the traffic times of the records, oldest first
+        """
+        times = self.trafficTimes[self.indices()]
+        return times[~np.isnan(times)].tolist()
+
+    def nbytes(self):
+        return self.endTimes.nbytes + self.trafficTimes.nbytes
+
 
 class DriveTime(object):
 
+    __slots__ = ("carId", "startTime", "endTime", "startingPos", "curtPos", "endPos", "crash")
+
     def __init__(self, startTime, pos, carId):
         """
         :param startTime: (int) the timestamp when the car is entering the road
@@ -0,0 +1,236 @@
+import numpy as np
+
+
+class RoadGraph(object):
+    """
+    An integer-indexed view of the map's topology. Each intersection is a node and each road is
+    a directed edge. The graph keeps CSR (compressed sparse row) out- and in-adjacency in the same
+    order as Intersection.outRoads and Intersection.inRoads, a pointer to the edge of the opposite
+    direction, and a hash map from (source node, target node) to the edge. The Intersection and
+    Road objects stay the interface for the rest of the simulator; they get their node and edge
+    ids (nodeIdx and edgeIdx) from this graph.
+    """
+
+    def __init__(self, intersections, roads):
+        """
+        :param intersections: a list of Intersection objects
+        :param roads: a list of Road objects whose source and target are in the intersections
+        """
+        self.nodes = []
+        self.edges = []
+        for inter in intersections:
+            self.addNode(inter)
+        for rd in roads:
+            self.addEdge(rd)
+        # the road lists may refer to objects that are not in the given lists
+        i = 0
+        while i < len(self.nodes):
+            for rd in self.nodes[i].getOutRoads() + self.nodes[i].getInRoads():
+                self.addEdge(rd)
+            i += 1
+
+        self.edgeSource = np.array([rd.getSource().nodeIdx for rd in self.edges], dtype=np.int32)
+        self.edgeTarget = np.array([rd.getTarget().nodeIdx for rd in self.edges], dtype=np.int32)
+        self.outOffsets, self.outEdges = RoadGraph.makeCSR([inter.getOutRoads() for inter in self.nodes])
+        self.inOffsets, self.inEdges = RoadGraph.makeCSR([inter.getInRoads() for inter in self.nodes])
+
+        # (source node, target node) -> edge id. The roads in the intersections' out-road lists go
+        # first, so they win when more than one road connects the same pair.
+        self.edgeIndex = {}
+        for rd in [rd for inter in self.nodes for rd in inter.getOutRoads()] + self.edges:
+            self.edgeIndex.setdefault((rd.getSource().nodeIdx, rd.getTarget().nodeIdx), rd.edgeIdx)
+
+        self.opposite = np.array([self.edgeIndex.get((t, s), -1)
+                                  for s, t in zip(self.edgeSource.tolist(), self.edgeTarget.tolist())],
+                                 dtype=np.int32)
+        for rd, op in zip(self.edges, self.opposite.tolist()):
+            rd.oppositeRoad = self.edges[op] if op >= 0 else None
+
+        self.component = None       # node id -> strongly connected component id
+        self.componentSizes = None  # component id -> number of nodes
+        self.giantComponent = -1    # the id of the component the cars drive in, by default the largest
+        self.reachableComponents = {}  # component id -> set of the components reachable from it
+        self.computeComponents()
+
+    def addNode(self, inter):
+        if not self.hasNode(inter):
+            inter.nodeIdx = len(self.nodes)
+            self.nodes.append(inter)
+
+    def addEdge(self, rd):
+        if not self.hasEdge(rd):
+            rd.edgeIdx = len(self.edges)
+            self.edges.append(rd)
+            self.addNode(rd.getSource())
+            self.addNode(rd.getTarget())
+
+    @classmethod
+    def makeCSR(cls, lists):
+        """
+        :param lists: a list of road lists, one for each node
+        :return: (offsets, edge ids); the edges of node i are edges[offsets[i]:offsets[i + 1]]
+        """
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(l) for l in lists])
+        edges = np.array([rd.edgeIdx for l in lists for rd in l], dtype=np.int32)
+        return offsets, edges
+
+    def computeComponents(self):
+        """
+        Find the strongly connected components with an iterative version of Tarjan's algorithm.
+        Two intersections are in the same component if and only if each can be reached from the other.
+        The components are numbered in reverse topological order: an edge never goes from a component
+        to one with a larger id.
+        """
+        n = len(self.nodes)
+        outOffsets = self.outOffsets.tolist()
+        targets = self.edgeTarget[self.outEdges].tolist()
+        index = [-1] * n    # the visiting order of each node
+        lowLink = [0] * n
+        onStack = [False] * n
+        component = [-1] * n
+        stack = []
+        counter = 0
+        componentNum = 0
+
+        for root in xrange(n):
+            if index[root] >= 0:
+                continue
+            work = [(root, outOffsets[root])]
+            index[root] = lowLink[root] = counter
+            counter += 1
+            stack.append(root)
+            onStack[root] = True
+            while work:
+                node, i = work[-1]
+                if i < outOffsets[node + 1]:
+                    work[-1] = (node, i + 1)
+                    nxt = targets[i]
+                    if index[nxt] < 0:
+                        index[nxt] = lowLink[nxt] = counter
+                        counter += 1
+                        stack.append(nxt)
+                        onStack[nxt] = True
+                        work.append((nxt, outOffsets[nxt]))
+                    elif onStack[nxt] and index[nxt] < lowLink[node]:
+                        lowLink[node] = index[nxt]
+                    continue
+
+                work.pop()
+                if work and lowLink[node] < lowLink[work[-1][0]]:
+                    lowLink[work[-1][0]] = lowLink[node]
+                if lowLink[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        onStack[member] = False
+                        component[member] = componentNum
+                        if member == node:
+                            break
+                    componentNum += 1
+
+        self.component = np.array(component, dtype=np.int32)
+        self.componentSizes = np.bincount(self.component, minlength=componentNum)
+        self.giantComponent = int(np.argmax(self.componentSizes)) if componentNum else -1
+        self.reachableComponents = {}
+
+    def componentNum(self):
+        return len(self.componentSizes)
+
+    def isInGiantComponent(self, inter):
+        """
+        :param inter: Intersection
+        :return: True if the intersection is in the giant component (see giantComponent)
+        """
+        return self.hasNode(inter) and self.component[inter.nodeIdx] == self.giantComponent
+
+    def isRoadInGiantComponent(self, road):
+        """
+        :param road: Road
+        :return: True if both ends of the road are in the giant component (see giantComponent)
+        """
+        return self.isInGiantComponent(road.getSource()) and self.isInGiantComponent(road.getTarget())
+
+    def isReachable(self, source, target):
+        """
+        Check whether there is a route from the source intersection to the target intersection.
+        It is O(1) when both are in the same component (always true in the giant component). Otherwise,
+        the components reachable from the source's component are found once and cached.
+        :param source: Intersection
+        :param target: Intersection
+        :return: boolean
+        """
+        if not self.hasNode(source) or not self.hasNode(target):
+            return False
+        sourceComp = int(self.component[source.nodeIdx])
+        targetComp = int(self.component[target.nodeIdx])
+        if sourceComp == targetComp:
+            return True
+        if targetComp > sourceComp:  # the edges only go to the components with smaller ids
+            return False
+        if sourceComp not in self.reachableComponents:
+            self.reachableComponents[sourceComp] = self.findReachableComponents(sourceComp)
+        return targetComp in self.reachableComponents[sourceComp]
+
+    def findReachableComponents(self, comp):
+        """
+        :param comp: component id
+        :return: a set of the components that can be reached from the given component
+        """
+        members = np.flatnonzero(self.component == comp).tolist()
+        found = set([comp])
+        queue = members
+        seen = set(members)
+        while queue:
+            node = queue.pop()
+            for edge in self.outEdgeIds(node).tolist():
+                nxt = int(self.edgeTarget[edge])
+                if nxt not in seen:
+                    seen.add(nxt)
+                    found.add(int(self.component[nxt]))
+                    queue.append(nxt)
+        return found
+
+    def nodeNum(self):
+        return len(self.nodes)
+
+    def edgeNum(self):
+        return len(self.edges)
+
+    def hasNode(self, inter):
+        idx = inter.nodeIdx
+        return idx is not None and idx < len(self.nodes) and self.nodes[idx] is inter
+
+    def hasEdge(self, rd):
+        idx = rd.edgeIdx
+        return idx is not None and idx < len(self.edges) and self.edges[idx] is rd
+
+    def getEdgeId(self, sourceIdx, targetIdx):
+        """
+        :return: the id of the edge from the source node to the target node; -1 if there is no such edge
+        """
+        return self.edgeIndex.get((sourceIdx, targetIdx), -1)
+
+    def getRoad(self, source, target):
+        """
+        Find the road from the source intersection to the target intersection in O(1).
+        :param source: Intersection
+        :param target: Intersection
+        :return: Road object or None
+        """
+        if not self.hasNode(source) or not self.hasNode(target):
+            return None
+        edge = self.edgeIndex.get((source.nodeIdx, target.nodeIdx), -1)
+        return self.edges[edge] if edge >= 0 else None
+
+    def getOppositeRoad(self, road):
+        """
+        :return: the road of the opposite direction of the given road; None if there is no such road
+        """
+        edge = self.opposite[road.edgeIdx]
+        return self.edges[edge] if edge >= 0 else None
+
+    def outEdgeIds(self, nodeIdx):
+        return self.outEdges[self.outOffsets[nodeIdx]:self.outOffsets[nodeIdx + 1]]
+
+    def inEdgeIds(self, nodeIdx):
+        return self.inEdges[self.inOffsets[nodeIdx]:self.inOffsets[nodeIdx + 1]]
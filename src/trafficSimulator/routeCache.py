@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from config import ROUTE_CACHE_SIZE
+
+
+class RouteCache(object):
+    """
+    A least recently used cache of the routes found by the navigator, keyed on the source intersection,
+    the destination, the routing algorithm and the travel time epoch. The route does not depend on
+    anything else, so the cars sent between the same places in one epoch share a search. The routes of
+    the older epochs can never be found again, so the cache is emptied when the epoch advances.
+    """
+
+    def __init__(self, maxRoadNum=ROUTE_CACHE_SIZE):
+        """
+        :param maxRoadNum: the maximum total number of roads in the kept routes (an empty route counts as
+                           one road); 0: keep nothing
+        """
+        self.maxRoadNum = maxRoadNum
+        self.routes = OrderedDict()  # key -> route (a list of roads), from the least to the most recently used
+        self.roadNum = 0             # the total number of roads in the kept routes
+        self.epoch = None            # the travel time epoch of the kept routes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """
+        :param key: (source intersection, destination, algorithm, epoch)
+        :return: a copy of the kept route of the key, or None
+        """
+        if key[-1] != self.epoch:
+            self.clear()
+            self.epoch = key[-1]
+        route = self.routes.pop(key, None)
+        if route is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.routes[key] = route
+        return list(route)
+
+    def put(self, key, route):
+        """
+        Keep a copy of the route, and drop the least recently used routes if there are too many roads.
+        """
+        if route is None or self.routeSize(route) > self.maxRoadNum or key[-1] != self.epoch:
+            return
+        if key in self.routes:
+            self.roadNum -= self.routeSize(self.routes.pop(key))
+        self.routes[key] = list(route)
+        self.roadNum += self.routeSize(route)
+        while self.roadNum > self.maxRoadNum:
+            _, evicted = self.routes.popitem(last=False)
+            self.roadNum -= self.routeSize(evicted)
+            self.evictions += 1
+
+    @classmethod
+    def routeSize(cls, route):
+        return max(len(route), 1)
+
+    def clear(self):
+        self.routes.clear()
+        self.roadNum = 0
+
+    def __len__(self):
+        return len(self.routes)
@@ -0,0 +1,190 @@
+from __future__ import division
+import os
+import hashlib
+import numpy as np
+
+from trafficUtil import RoadType
+
+
+def hashShapefile(shapefileName, extensions=(".shp", ".shx", ".dbf")):
+    """
+    Hash the content of a shapefile (all of its component files).
+    :param shapefileName: the file name of the shapefile
+    :return: a hashlib object that can be updated with more data
+    """
+    sha = hashlib.sha1()
+    base = os.path.splitext(shapefileName)[0]
+    for ext in extensions:
+        if not os.path.exists(base + ext):
+            continue
+        with open(base + ext, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), ""):
+                sha.update(chunk)
+    return sha
+
+
+def stampShapefile(shapefileName, extensions=(".shp", ".shx", ".dbf")):
+    """
+    Hash the size and the modification time of a shapefile's component files. It is a cheap stand-in
+    for hashShapefile: a changed file is found without reading it.
+    :param shapefileName: the file name of the shapefile
+    :return: a hashlib object that can be updated with more data
+    """
+    sha = hashlib.sha1()
+    base = os.path.splitext(shapefileName)[0]
+    for ext in extensions:
+        if not os.path.exists(base + ext):
+            continue
+        stat = os.stat(base + ext)
+        sha.update("%s|%d|%r|" % (ext, stat.st_size, stat.st_mtime))
+    return sha
+
+
+class MapRegion(object):
+    """
+    The region of interest of a map. It is either a bounding box or a polygon in GPS coordinates.
+    """
+
+    def __init__(self, box=None, polygon=None):
+        """
+        :param box: (top, bot, right, left) of the region
+        :param polygon: a list of (lng, lat) points of the region's border
+        """
+        if polygon:
+            self.polygon = [(float(lng), float(lat)) for lng, lat in polygon]
+            lngs = [p[0] for p in self.polygon]
+            lats = [p[1] for p in self.polygon]
+            self.box = max(lats), min(lats), max(lngs), min(lngs)
+        else:
+            self.polygon = None
+            self.box = tuple(float(v) for v in box)
+
+    @classmethod
+    def fromSetting(cls, region):
+        """
+        Create a region from the MAP_REGION setting.
+        :param region: None, (top, bot, right, left), or a list of (lng, lat) points
+        :return: MapRegion object or None
+        """
+        if region is None or isinstance(region, MapRegion):
+            return region
+        if len(region) == 4 and all(isinstance(v, (int, float)) for v in region):
+            return cls(box=region)
+        return cls(polygon=region)
+
+    def key(self):
+        """
+        :return: (str) a string that identifies this region
+        """
+        if self.polygon:
+            return "polygon:" + ",".join("%r,%r" % p for p in self.polygon)
+        return "box:" + ",".join("%r" % v for v in self.box)
+
+    def overlapBoxes(self, boxes):
+        """
+        :param boxes: (n, 4) array of (top, bot, right, left)
+        :return: (n,) boolean array; True if a box overlaps the bounding box of this region
+        """
+        top, bot, right, left = self.box
+        return (boxes[:, 1] <= top) & (boxes[:, 0] >= bot) & (boxes[:, 3] <= right) & (boxes[:, 2] >= left)
+
+    def matches(self, points):
+        """
+        Check whether a record (given by its points) is in this region. For a bounding box, the
+        index has already checked it. For a polygon, one of the points has to be in the polygon,
+        or the record's bounding box contains one of the polygon's vertices.
+        :param points: a list of (lng, lat) points of a record
+        :return: boolean
+        """
+        if not self.polygon:
+            return True
+        for lng, lat in points:
+            if self.containsPoint(lng, lat):
+                return True
+        lngs = [p[0] for p in points]
+        lats = [p[1] for p in points]
+        for lng, lat in self.polygon:
+            if min(lngs) <= lng <= max(lngs) and min(lats) <= lat <= max(lats):
+                return True
+        return False
+
+    def containsPoint(self, lng, lat):
+        """
+        Ray casting test for the polygon.
+        """
+        inside = False
+        j = len(self.polygon) - 1
+        for i in xrange(len(self.polygon)):
+            lngI, latI = self.polygon[i]
+            lngJ, latJ = self.polygon[j]
+            if (latI > lat) != (latJ > lat) and lng < (lngJ - lngI) * (lat - latI) / (latJ - latI) + lngI:
+                inside = not inside
+            j = i
+        return inside
+
+
+class ShapefileIndex(object):
+    """
+    A persisted index of a shapefile's records. It stores the bounding box and the road type
+    of every record, so a region can be loaded by reading only its records from the disk.
+    The index is built by reading the whole shapefile once and is saved next to the compiled maps.
+    """
+
+    TYPE_CODES = {RoadType.ROAD: 1, RoadType.INTERSECTION: 2}
+
+    def __init__(self, reader, digest, folder):
+        """
+        :param reader: the shapefile.Reader of the shapefile
+        :param digest: (str) the hex digest of the shapefile from stampShapefile
+        :param folder: the folder for the index file
+        """
+        self.reader = reader
+        self.folder = folder
+        self.filename = os.path.join(folder, "index_%s.npz" % digest)
+        self.boxes = None  # (n, 4) array of (top, bot, right, left)
+        self.types = None  # (n,) array of the type codes; 0 for the types we don't use
+
+    def load(self):
+        if self.boxes is not None:
+            return
+        if os.path.exists(self.filename):
+            data = np.load(self.filename)
+            self.boxes = data["boxes"]
+            self.types = data["types"]
+        else:
+            self.build()
+
+    def build(self):
+        """
+        Read every record and save the index file.
+        """
+        print "Building shapefile index",
+        boxes = []
+        types = []
+        for i, sh in enumerate(self.reader.iterShapeRecords()):
+            if i % 10000 == 0:  # showing progress
+                print ".",
+            if sh.shape.points:
+                left, bot, right, top = sh.shape.bbox
+            else:
+                left = bot = right = top = np.nan
+            boxes.append((top, bot, right, left))
+            types.append(ShapefileIndex.TYPE_CODES.get(sh.record[3], 0))
+        print ""
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self.types = np.array(types, dtype=np.int8)
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        tmpName = self.filename + ".tmp.npz"
+        np.savez(tmpName, boxes=self.boxes, types=self.types)
+        os.rename(tmpName, self.filename)
+
+    def query(self, region):
+        """
+        Find the roads and intersections whose bounding boxes overlap the region.
+        :param region: MapRegion object
+        :return: an array of record indices in ascending order
+        """
+        self.load()
+        return np.flatnonzero((self.types > 0) & region.overlapBoxes(self.boxes))
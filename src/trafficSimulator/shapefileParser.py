@@ -2,12 +2,17 @@ import shapefile as shp
 import pygmaps
 import webbrowser
 import os
+import numpy as np
+from array import array
 
 from trafficUtil import RoadType
 from road import Road
 from intersection import Intersection
 from coordinate import Coordinate
 from factory import RoadFactory
+from shapefileIndex import ShapefileIndex
+from shapefileIndex import stampShapefile
+from config import MAP_CACHE_FOLDER
 
 
 class Shapefile(object):
@@ -15,13 +20,21 @@ class Shapefile(object):
     A class that load road data from a shapefile and output as desired data structure.
     """
 
-    def __init__(self, filename, dataNum):
+    def __init__(self, filename, dataNum, region=None, indexFolder=MAP_CACHE_FOLDER):
         """
         :param filename: the filename of a shapefile
+        :param dataNum: the number of records to be read from the beginning of the shapefile
+        :param region: (MapRegion) only read the records in this region; dataNum is not used then
+        :param indexFolder: the folder for the persisted index that is used for reading a region
         """
+        self.filename = filename
         self.ctr = shp.Reader(filename)
-        self.shapeRecords = self.ctr.iterShapeRecords()
+        self.digest = stampShapefile(filename).hexdigest()  # names the index and compiled map files of this version
         self.dataNum = dataNum
+        self.region = region
+        self.index = ShapefileIndex(self.ctr, self.digest, indexFolder) if region is not None else None
+        self.columns = None  # key: road type, value: ShapeColumns
+        self.records = {}    # key: road type, value: a list of roads or intersections in the columns' order
 
         self.roads = {}
         self.intersections = {}
@@ -38,7 +51,7 @@ class Shapefile(object):
         :return: a dictionary containing road data
         """
         if not self.roads:
-            self.roads = self.readData(RoadType.ROAD)
+            self.roads = self.makeData(RoadType.ROAD)
         return self.roads
 
     def getIntersections(self):
@@ -47,59 +60,97 @@ class Shapefile(object):
         :return: a dictionary containing intersection data
         """
         if not self.intersections:
-            self.intersections = self.readData(RoadType.INTERSECTION)
+            self.intersections = self.makeData(RoadType.INTERSECTION)
         return self.intersections
 
-    def readData(self, roadType):
+    def getColumns(self, roadType):
         """
-        Get the data out according to given road type. The road types include
+        Get the columnar data of the given road type. The shapefile is read on the first call.
+        :param roadType: the given road type.
+        :return: a ShapeColumns object
+        """
+        if self.columns is None:
+            self.readData()
+        return self.columns[roadType]
+
+    def readData(self):
+        """
+        Read the records of the shapefile in one pass (see iterShapeRecords). The road types include
         'Median Hidden', 'Median Island', 'Parking Garage', 'Road Hidden', 'Alley',
         'Paved Drive', 'Hidden Median', 'Parking Lot', 'trafficSimulator Island', 'Intersection',
-        'Road'. The output coordinate will be the center (average of the coordinates)
-        of the road type.
-
-        :param roadType: the given road type.
-        :return: a dictionary of coordinates for the road type.
+        'Road'. Only roads and intersections are kept. For each of them, the center (average of
+        the coordinates), the bounding box and the corner points are stored in a ShapeColumns.
         """
-        print "Loading", roadType,
+        print "Loading shapefile",
+        columns = {RoadType.ROAD: ShapeColumns(), RoadType.INTERSECTION: ShapeColumns()}
         i = 0
-        result = {}
-        for sh in self.ctr.iterShapeRecords():
+        for sh in self.iterShapeRecords():
             i += 1
             if i % 10000 == 0:  # showing progress
                 print ".",
-            if i > self.dataNum:
-                break
-            if sh.record[3] == roadType:
-                lats = [p[1] for p in sh.shape.points]
-                lnts = [p[0] for p in sh.shape.points]
-                centerLats = sum(lats) / float(len(lats)) if len(lats) > 0 else None
-                centerLnts = sum(lnts) / float(len(lnts)) if len(lnts) > 0 else None
-                center = Coordinate(centerLnts, centerLats)
-
-                maxLat, minLat = max(lats), min(lats)
-                maxLnt, minLnt = max(lnts), min(lnts)
-                corners = [Coordinate(p[1], p[0]) for p in sh.shape.points if p[1] == maxLat or
-                                                                              p[1] == minLat or
-                                                                              p[0] == maxLnt or
-                                                                              p[0] == minLnt]
-
-                # Find the top, bottom, right, and left of this map
-                if self.top is None or self.top < maxLat:
-                    self.top = maxLat
-                if self.right is None or self.right < maxLnt:
-                    self.right = maxLnt
-                if self.bot is None or self.bot > minLat:
-                    self.bot = minLat
-                if self.left is None or self.left > minLnt:
-                    self.left = minLnt
-
-                rdInter = RoadFactory.makeRoads(roadType, corners, center)
-                result[rdInter.id] = rdInter
+            roadType = sh.record[3]
+            if roadType not in columns or not sh.shape.points:
+                continue
+
+            maxLat, minLat, maxLnt, minLnt = columns[roadType].append(sh.shape.points)
 
+            # Find the top, bottom, right, and left of this map
+            if self.top is None or self.top < maxLat:
+                self.top = maxLat
+            if self.right is None or self.right < maxLnt:
+                self.right = maxLnt
+            if self.bot is None or self.bot > minLat:
+                self.bot = minLat
+            if self.left is None or self.left > minLnt:
+                self.left = minLnt
+
+        for col in columns.values():
+            col.freeze()
+        self.columns = columns
         print ""
+
+    def iterShapeRecords(self):
+        """
+        Iterate the records to be loaded: the first dataNum records, or if a region is given,
+        only the records in the region by using the index.
+        """
+        if self.region is None:
+            for i, sh in enumerate(self.ctr.iterShapeRecords()):
+                if i >= self.dataNum:
+                    break
+                yield sh
+        else:
+            for i in self.index.query(self.region):
+                sh = self.ctr.shapeRecord(int(i))
+                if self.region.matches(sh.shape.points):
+                    yield sh
+
+    def makeData(self, roadType):
+        """
+        Create the roads or intersections of the given road type from the columnar data.
+        :param roadType: the given road type.
+        :return: a dictionary of roads or intersections, keyed by their ids.
+        """
+        col = self.getColumns(roadType)
+        result = {}
+        self.records[roadType] = []
+        for i in xrange(len(col)):
+            rdInter = RoadFactory.makeRoads(roadType, col.getCorners(i), col.getCenter(i))
+            result[rdInter.id] = rdInter
+            self.records[roadType].append(rdInter)
         return result
 
+    def getRecordObjects(self, roadType):
+        """
+        :param roadType: the given road type.
+        :return: a list of the roads or intersections in the same order as their columnar data
+        """
+        if roadType == RoadType.ROAD:
+            self.getRoads()
+        else:
+            self.getIntersections()
+        return self.records[roadType]
+
     def makeRoads(self, roadType, corners, center):
         """
         Create a road or intersection according to the given road type.
@@ -140,6 +191,69 @@ class Shapefile(object):
         url = "file://" + os.getcwd() + "/" + mapFilename
         webbrowser.open_new(url)
 
+
+class ShapeColumns(object):
+    """
+    Store the records of one road type in flat arrays instead of Python objects.
+    Record i has its center at centers[i] (lng, lat), its bounding box at boxes[i]
+    (top, bottom, right, left), and its corner points at
+    corners[cornerOffsets[i]:cornerOffsets[i + 1]] as shapefile (x, y) points.
+    """
+
+    def __init__(self):
+        self.centers = array('d')
+        self.boxes = array('d')
+        self.corners = array('d')
+        self.cornerOffsets = array('l', [0])
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, points):
+        """
+        Add a record by its shape points.
+        :param points: a list of (x, y) points, where x is the longitude and y is the latitude
+        :return: the bounding box (maxLat, minLat, maxLnt, minLnt) of this record
+        """
+        lats = [p[1] for p in points]
+        lnts = [p[0] for p in points]
+        maxLat, minLat = max(lats), min(lats)
+        maxLnt, minLnt = max(lnts), min(lnts)
+        self.centers.extend((sum(lnts) / float(len(lnts)), sum(lats) / float(len(lats))))
+        self.boxes.extend((maxLat, minLat, maxLnt, minLnt))
+
+        cornerNum = 0
+        for p in points:
+            if p[1] == maxLat or p[1] == minLat or p[0] == maxLnt or p[0] == minLnt:
+                self.corners.extend((p[0], p[1]))
+                cornerNum += 1
+        self.cornerOffsets.append(self.cornerOffsets[-1] + cornerNum)
+        self.size += 1
+        return maxLat, minLat, maxLnt, minLnt
+
+    def freeze(self):
+        """
+        Convert the growing arrays to NumPy arrays after all the records are read.
+        """
+        self.centers = np.frombuffer(self.centers, dtype=np.float64).reshape(-1, 2)
+        self.boxes = np.frombuffer(self.boxes, dtype=np.float64).reshape(-1, 4)
+        self.corners = np.frombuffer(self.corners, dtype=np.float64).reshape(-1, 2)
+        self.cornerOffsets = np.array(self.cornerOffsets, dtype=np.int64)
+
+    def getCenter(self, i):
+        lng, lat = self.centers[i]
+        return Coordinate(float(lng), float(lat))
+
+    def getCorners(self, i):
+        """
+        Note: the corners keep the (lat, lng) order that the roads and intersections use
+        for checking their connection.
+        """
+        return [Coordinate(float(y), float(x))
+                for x, y in self.corners[self.cornerOffsets[i]:self.cornerOffsets[i + 1]]]
+
+
 # =========================================================
 # For checking the correctness
 # =========================================================
@@ -0,0 +1,71 @@
+from __future__ import division
+import math
+from collections import defaultdict
+
+
+class SpatialGrid(object):
+    """
+    A uniform grid that buckets objects by their bounding boxes. A point query only
+    returns the objects whose bounding boxes cover the grid cell of the point, so
+    we do not need to check every object for every point.
+    """
+
+    def __init__(self, cellSize):
+        """
+        :param cellSize: (float) the width and height (in GPS degree) of a grid cell
+        """
+        self.cellSize = cellSize
+        self.cells = defaultdict(list)  # key: (x, y) cell, value: list of (order, item)
+        self.size = 0
+
+    @classmethod
+    def fromRoads(cls, roads, cellSize=None):
+        """
+        Build a grid for the given roads. If the cell size is not given, use the average
+        extent of the roads' bounding boxes so that a road only covers a few cells.
+        :param roads: a list of Road objects
+        :param cellSize: (float) the size of a grid cell
+        :return: a SpatialGrid object
+        """
+        if not cellSize:
+            extents = [max(rd.top - rd.bottom, rd.right - rd.left) for rd in roads]
+            cellSize = sum(extents) / len(extents) if extents else 0
+            if cellSize <= 0:
+                cellSize = 1.0
+
+        grid = cls(cellSize)
+        for rd in roads:
+            grid.insert(rd, rd.top, rd.bottom, rd.right, rd.left)
+        return grid
+
+    def cellOf(self, lng, lat):
+        """
+        :return: (x, y) index of the cell that contains the given point
+        """
+        return int(math.floor(lng / self.cellSize)), int(math.floor(lat / self.cellSize))
+
+    def insert(self, item, top, bottom, right, left):
+        """
+        Add the item to every cell that its bounding box overlaps.
+        The insertion order is kept so that queries return items in the same order
+        as they were inserted.
+        """
+        minX, minY = self.cellOf(left, bottom)
+        maxX, maxY = self.cellOf(right, top)
+        for x in xrange(minX, maxX + 1):
+            for y in xrange(minY, maxY + 1):
+                self.cells[(x, y)].append((self.size, item))
+        self.size += 1
+
+    def queryPoints(self, points):
+        """
+        Find the items whose cells contain any of the given points.
+        :param points: a list of Coordinate objects
+        :return: a list of items sorted by their insertion order
+        """
+        found = {}
+        for p in points:
+            lng, lat = p.getCoords()
+            for order, item in self.cells.get(self.cellOf(lng, lat), []):
+                found[order] = item
+        return [found[order] for order in sorted(found)]
@@ -0,0 +1,112 @@
+from __future__ import division
+import math
+import multiprocessing
+import numpy as np
+
+
+POINT_CHUNK = 2048
+"""The number of intersection corners tested against the roads of a tile at a time"""
+
+
+def findTileConnections(task):
+    """
+    Find the connected (intersection, road) pairs of one tile. A road is connected to an
+    intersection if one of the intersection's corners is in the road's bounding box (the
+    same test as Road.isConnected). This function runs in the worker processes.
+    :param task: (points, pointOwners, roadIdx, boxes)
+                 points: (k, 2) array of the corners (x, y) of the tile's intersections
+                 pointOwners: (k,) array of the intersection index of each corner
+                 roadIdx: (m,) array of the road indices of the roads near the tile
+                 boxes: (m, 4) array of the roads' (top, bot, right, left)
+    :return: (n, 2) array of (intersection index, road index)
+    """
+    points, pointOwners, roadIdx, boxes = task
+    pairs = [np.zeros((0, 2), dtype=np.int64)]
+    if len(roadIdx) == 0:
+        return pairs[0]
+    for start in xrange(0, len(points), POINT_CHUNK):
+        x = points[start:start + POINT_CHUNK, 0][:, np.newaxis]
+        y = points[start:start + POINT_CHUNK, 1][:, np.newaxis]
+        hit = (boxes[:, 3] <= x) & (x <= boxes[:, 2]) & (boxes[:, 1] <= y) & (y <= boxes[:, 0])
+        pointHit, roadHit = np.nonzero(hit)
+        pairs.append(np.column_stack((pointOwners[start + pointHit], roadIdx[roadHit])))
+    pairs = np.concatenate(pairs)
+    if len(pairs) == 0:
+        return pairs
+    # an intersection may hit a road with more than one corner
+    return np.unique(pairs, axis=0)
+
+
+class TiledMapBuilder(object):
+    """
+    Find the connections between intersections and roads by splitting the extent of the
+    shapefile into tiles. Every intersection belongs to the tile of its center, and every tile
+    is checked against the roads whose bounding boxes overlap the tile's intersections, so the
+    roads that cross the tiles' borders are found in all the tiles they touch. The tiles are
+    processed by a multiprocessing pool.
+    """
+
+    def __init__(self, interColumns, roadColumns, processes, tileNum=None):
+        """
+        :param interColumns: ShapeColumns of the intersections
+        :param roadColumns: ShapeColumns of the roads
+        :param processes: (int) the number of worker processes
+        :param tileNum: (int) the number of tiles; None: 4 tiles for each process
+        """
+        self.interColumns = interColumns
+        self.roadColumns = roadColumns
+        self.processes = max(1, processes)
+        self.tileNum = tileNum or 4 * self.processes
+
+    def makeTiles(self):
+        """
+        :return: a list of tasks for findTileConnections
+        """
+        inters = self.interColumns
+        roads = self.roadColumns
+        if len(inters) == 0:
+            return []
+
+        side = int(math.ceil(math.sqrt(self.tileNum)))
+        centers = inters.centers
+        minX, minY = centers.min(axis=0)
+        maxX, maxY = centers.max(axis=0)
+        width = max((maxX - minX) / side, 1e-12)
+        height = max((maxY - minY) / side, 1e-12)
+        tileX = np.minimum(((centers[:, 0] - minX) / width).astype(np.int64), side - 1)
+        tileY = np.minimum(((centers[:, 1] - minY) / height).astype(np.int64), side - 1)
+        tiles = tileX * side + tileY
+
+        cornerNum = np.diff(inters.cornerOffsets)
+        pointOwners = np.repeat(np.arange(len(inters)), cornerNum)
+        pointTiles = tiles[pointOwners]
+
+        tasks = []
+        for tile in np.unique(tiles):
+            inTile = pointTiles == tile
+            points = inters.corners[inTile]
+            left, bot = points.min(axis=0)
+            right, top = points.max(axis=0)
+            boxes = roads.boxes
+            near = np.flatnonzero((boxes[:, 1] <= top) & (boxes[:, 0] >= bot) &
+                                  (boxes[:, 3] <= right) & (boxes[:, 2] >= left))
+            tasks.append((points, pointOwners[inTile], near, boxes[near]))
+        return tasks
+
+    def findConnections(self):
+        """
+        :return: (n, 2) array of the connected (intersection index, road index) pairs. The indices
+                 are the records' positions in the ShapeColumns.
+        """
+        tasks = self.makeTiles()
+        if self.processes > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                results = pool.map(findTileConnections, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = map(findTileConnections, tasks)
+        results.append(np.zeros((0, 2), dtype=np.int64))
+        return np.concatenate(results)
@@ -1,5 +1,6 @@
 import sys
 import heapq
+import bisect
 
 from collections import defaultdict
 from fixedRandom import FixedRandom
@@ -19,8 +20,23 @@ class Traffic(object):
 
     @classmethod
     def uniqueId(cls, idType):
+        return idType + "_" + str(cls.uniqueNumber(idType))
+
+    @classmethod
+    def uniqueNumber(cls, idType):
+        """
+        :return: (int) the next dense integer id of the given type, starting from 1
+        """
         cls.uniqueid[idType] += 1
-        return idType + "_" + str(cls.uniqueid[idType])
+        return cls.uniqueid[idType]
+
+    @classmethod
+    def idNumber(cls, uid):
+        """
+        :param uid: an id made by uniqueId, e.g. "Road_150"
+        :return: (int) the number of the id, e.g. 150
+        """
+        return int(uid.rsplit("_", 1)[1])
 
     @classmethod
     def increaseGlobalTime(cls, deltaTime):
@@ -98,6 +114,76 @@ class PriorityItemQueue(object):
             return self.items[item].priority
 
 
+class FenwickTree(object):
+    """
+    A Fenwick tree (binary indexed tree) of numbers. Both updating a value and
+    summing a prefix of the values take O(log n).
+    """
+
+    def __init__(self, values=()):
+        """
+        Build the tree in O(n).
+        :param values: the initial values
+        """
+        self.tree = [0] + list(values)
+        for i in xrange(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, idx, delta):
+        """
+        Add delta to the value at idx.
+        """
+        i = idx + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefixSum(self, idx):
+        """
+        :return: the sum of the values before idx
+        """
+        total = 0
+        i = idx
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def total(self):
+        return self.prefixSum(len(self))
+
+
+class IntervalIndex(object):
+    """
+    A sorted index of closed intervals [start, end]. The intervals must not be nested (e.g. they
+    have the same width or do not overlap), so sorting them by start also sorts them by end, and
+    a point query only needs to check the last interval that starts before the point: O(log n).
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, end):
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+    def containsPoint(self, point):
+        """
+        :return: True if the point is in one of the intervals
+        """
+        i = bisect.bisect_right(self.starts, point)
+        return i > 0 and point <= self.ends[i - 1]
+
 
 def sampleOne(list):
     """
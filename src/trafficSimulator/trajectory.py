@@ -4,6 +4,7 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from lanePosition import LanePosition
+from vehicleStore import VehicleStore
 
 
 class Trajectory(object):
@@ -11,6 +12,8 @@ class Trajectory(object):
     A class that represents the trajectory of a car.
     """
 
+    __slots__ = ("car", "current", "next", "isChangingLanes", "absolutePosition")
+
     def __init__(self, car, lane, position=0):
         """
         :param car:
@@ -19,9 +22,9 @@ class Trajectory(object):
         :return:
         """
         self.car = car
-        self.current = LanePosition(self.car, lane, position)
+        self.current = LanePosition(self.car, lane, position, VehicleStore.CURRENT)
         self.current.acquire()
-        self.next = LanePosition(self.car)
+        self.next = LanePosition(self.car, slot=VehicleStore.NEXT)
         self.isChangingLanes = False
         self.absolutePosition = None
 
@@ -38,12 +41,14 @@ class Trajectory(object):
         return self.current.lane.road
 
     def getOppositeRoad(self):
-        source = self.current.lane.road.getSource()
-        sourceCoords = source.center.getCoords()
-        target = self.current.lane.road.getTarget()
-        for road in target.getOutRoads():
-            if road.target.center.getCoords() == sourceCoords:
-                return road
+        return self.current.lane.road.oppositeRoad
+
+    def setSpeed(self, speed):
+        """
+        Record the car's new speed in its LanePositions.
+        """
+        self.current.setSpeed(speed)
+        self.next.setSpeed(speed)
 
     def getAbsolutePosition(self):
         return self.current.position
@@ -135,7 +140,7 @@ class Trajectory(object):
         if distance < 0:
             return
 
-        self.current.position += distance
+        self.current.setPosition(self.current.position + distance)
         self.current.updateCarDriveTime()
 
         if self.timeToMakeTurn() and self.canEnterIntersection() and self.isValidTurn():
@@ -171,9 +176,7 @@ class Trajectory(object):
             print "not on the same road"
             return
         if targetLane.canSwitchLane(self.current.position):
-            self.current.release()
-            self.current.lane = targetLane
-            self.current.acquire()
+            self.current.changeLane(targetLane)
 
     def startChangingLanes(self, nextLane):
         """
@@ -0,0 +1,94 @@
+import numpy as np
+from trafficUtil import Traffic
+from config import TRAVEL_TIME_SNAPSHOT_INTERVAL
+from config import TRAVEL_TIME_EPOCH_TOLERANCE
+
+
+class TravelTimeSnapshot(object):
+    """
+    The average traffic time (Road.getAvgTrafficTime) of every road in one float array, indexed by
+    the roads' edge ids in the RoadGraph. It is published again when it is read after the global
+    time has advanced by the given interval, so all the routes and taxi dispatches between two
+    publications see the same travel times, and they read them by index instead of asking each road.
+    The epoch only advances when a publication changes the traffic times by more than the tolerance
+    since the start of the epoch, or changes a speed limit, so the routes of one epoch can be reused.
+    """
+
+    def __init__(self, graph, interval=TRAVEL_TIME_SNAPSHOT_INTERVAL, tolerance=TRAVEL_TIME_EPOCH_TOLERANCE):
+        """
+        :param graph: RoadGraph
+        :param interval: (second) the minimum global time between two publications; 0: once per tick
+        :param tolerance: the largest change of the traffic times within an epoch, relative to their sum
+        """
+        self.graph = graph
+        self.interval = interval
+        self.tolerance = tolerance
+        self.times = np.zeros(graph.edgeNum())  # edge id -> the traffic time (second) of the road
+        self.timeList = []                      # self.times as a list, for reading it item by item
+        self.publishTime = None                 # the global time of the last publication
+        self.version = 0                        # increased by every publication
+        self.speedLimits = np.zeros(graph.edgeNum())  # edge id -> the speed limit (km/h) of the road
+        self.maxSpeedLimit = 0                  # the highest speed limit (km/h) of the roads when it is published
+        self.epoch = 0                          # increased by the publications that change the times too much
+        self.epochTimes = None                  # the traffic times at the start of the epoch
+        self.epochSpeedLimits = None            # the speed limits at the start of the epoch
+
+    def isStale(self, curtTime):
+        if self.publishTime is None or curtTime < self.publishTime:  # the global time started from 0 again
+            return True
+        return curtTime != self.publishTime and curtTime - self.publishTime >= self.interval
+
+    def publish(self, curtTime):
+        self.times[:] = [road.getAvgTrafficTime() for road in self.graph.edges]
+        self.timeList = self.times.tolist()
+        self.speedLimits[:] = [road.speedLimit for road in self.graph.edges]
+        self.maxSpeedLimit = self.speedLimits.max() if len(self.speedLimits) else 0
+        self.publishTime = curtTime
+        self.version += 1
+        if self.hasEpochChanged():
+            self.epoch += 1
+            self.epochTimes = self.times.copy()
+            self.epochSpeedLimits = self.speedLimits.copy()
+
+    def hasEpochChanged(self):
+        """
+        :return: True if a speed limit or the traffic times (more than the tolerance) differ from the start of the epoch
+        """
+        if self.epochTimes is None:
+            return True
+        if (self.speedLimits != self.epochSpeedLimits).any():
+            return True
+        # the time of a single road can jump by many times when a car enters it, so the change is
+        # measured over all the roads
+        change = np.abs(self.times - self.epochTimes).sum()
+        return change > self.tolerance * self.epochTimes.sum() if self.tolerance else change > 0
+
+    def getTimes(self):
+        """
+        :return: a list of the traffic time of each road by its edge id (do not modify it)
+        """
+        if self.isStale(Traffic.globalTime):
+            self.publish(Traffic.globalTime)
+        return self.timeList
+
+    def getArray(self):
+        """
+        :return: the traffic times as a NumPy array (do not modify it)
+        """
+        self.getTimes()
+        return self.times
+
+    def getMaxSpeedLimit(self):
+        """
+        :return: the highest speed limit of the roads at the time of the published traffic times, so no
+                 road's traffic time is shorter than its length at this speed
+        """
+        self.getTimes()
+        return self.maxSpeedLimit
+
+    def getEpoch(self):
+        self.getTimes()
+        return self.epoch
+
+    def getTime(self, road):
+        return self.getTimes()[road.edgeIdx]
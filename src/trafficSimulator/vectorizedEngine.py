@@ -0,0 +1,148 @@
+import sys
+import math
+import numpy as np
+from trafficUtil import Traffic
+from engine import Engine
+
+
+class VectorizedEngine(object):
+    """
+    Compute the Intelligent Driver Model step of all moving vehicles at once with NumPy, using the
+    state in the VehicleStore. It gives the same acceleration, speed and step as Engine and
+    Car.calcMovingDist, but every vehicle sees the positions and speeds at the start of the tick
+    (after the lane changes of this tick) instead of the state left by the vehicles that moved
+    before it in the same tick. Since no vehicle moves further than its gap to the leader and the
+    leaders only move forward, the vehicles cannot run into each other.
+    """
+
+    def move(self, cars, second):
+        """
+        Move the given cars by the given time interval, like calling Car.move on each of them.
+        :param cars: a list of cars (and taxis)
+        :param second: the given time interval in second
+        """
+        cars = self.prepare(cars)
+        if not cars:
+            return
+        _, speed, step = self.computeSteps(cars, second)
+        self.apply(cars, speed, step)
+
+    def prepare(self, cars):
+        """
+        Update the routes and lanes of the cars that can move.
+        :return: the list of the cars that can move
+        """
+        # crashed or deleted car cannot move
+        cars = [car for car in cars if not car.crashed]
+        for car in cars:
+            car.prepareMove()
+        return cars
+
+    def computeSteps(self, cars, second):
+        """
+        Compute the IDM step of the given cars without changing their state.
+        :param cars: a list of prepared cars
+        :param second: the given time interval in second
+        :return: (acceleration, speed, step) arrays in the order of the cars
+        """
+        store = cars[0].store
+        carNum = len(cars)
+        rows = np.empty(carNum, dtype=np.int64)
+        leaderRows = np.full((carNum, 2), -1, dtype=np.int64)
+        leaderSlots = np.zeros((carNum, 2), dtype=np.int64)
+        laneLength = np.empty(carNum)
+        speedLimit = np.empty(carNum)
+        hasStopLine = np.empty(carNum, dtype=bool)
+
+        # the state that is not in the store is collected car by car
+        for i, car in enumerate(cars):
+            trajectory = car.trajectory
+            rows[i] = car.row
+            for slot, lanePos in enumerate((trajectory.current, trajectory.next)):
+                leader = lanePos.getNext()
+                if leader is not None:
+                    leaderRows[i, slot] = leader.row
+                    leaderSlots[i, slot] = leader.slot
+            lane = trajectory.current.lane
+            laneLength[i] = lane.getLength()
+            speedLimit[i] = lane.road.getSpeedLimit()
+            hasStopLine[i] = not trajectory.isChangingLanes and not trajectory.canEnterIntersection()
+
+        length = store.length[rows]
+        speed = store.speed[rows]
+        maxSpeed = store.maxSpeed[rows]
+        position = store.position[rows]
+
+        # the distance to the front car on the current or the next lane (Trajectory.nextCarDistance)
+        frontPosition = position + (length / 2.0)[:, np.newaxis]
+        hasLeader = leaderRows >= 0
+        safeRows = np.where(hasLeader, leaderRows, 0)
+        rearPosition = store.position[safeRows, leaderSlots] - store.length[safeRows] / 2.0
+        inFront = hasLeader & (frontPosition <= rearPosition) & (rearPosition < sys.maxint)
+        distances = np.where(inFront, rearPosition, float(sys.maxint)) - frontPosition
+        leaders = np.where(inFront, leaderRows, -1)
+        useCurrent = distances[:, 0] < distances[:, 1]
+        nextDistance = np.where(useCurrent, distances[:, 0], distances[:, 1])
+        nextLeader = np.where(useCurrent, leaders[:, 0], leaders[:, 1])
+
+        # the distance to the stop line (Trajectory.distanceToStopLine)
+        stopDistance = laneLength - position[:, 0] - length / 2.0
+        stopDistance = np.where(hasStopLine, np.maximum(stopDistance, 0), float(sys.maxint))
+
+        # the IDM acceleration (Engine.getAcceleration)
+        timeGap = speed * Engine.timeHeadAway / Traffic.SECOND_PER_HOUR
+        freeRoadCoeff = np.power(speed / maxSpeed, 4)
+
+        distanceToNextCar = np.maximum(nextDistance, 0)
+        deltaSpeed = np.where(nextLeader >= 0, speed - store.speed[np.maximum(nextLeader, 0)], 0)
+        breakGap = speed * deltaSpeed / (2 * math.sqrt(Engine.maxAcceleration * Engine.maxDeceleration))
+        safeDistance = Engine.distGap + timeGap + breakGap
+        busyRoadCoeff = self.ratioCoeff(safeDistance, distanceToNextCar)
+
+        safeIntersectionDist = 0.001 + timeGap + np.power(speed, 2) / (2 * Engine.maxDeceleration)
+        intersectionCoeff = self.ratioCoeff(safeIntersectionDist, stopDistance)
+
+        coeff = 1 - freeRoadCoeff - busyRoadCoeff - intersectionCoeff
+        acceleration = np.round(Engine.maxAcceleration * coeff, 10)
+
+        # the new speed and the distance of the move (Engine.setSpeed and Car.calcMovingDist)
+        newSpeed = np.round(speed + acceleration * second * Traffic.SECOND_PER_HOUR, 10)
+        newSpeed = np.minimum(np.minimum(maxSpeed, np.maximum(newSpeed, 0)), speedLimit)
+        step = np.maximum(newSpeed * second / Traffic.SECOND_PER_HOUR + 0.5 * acceleration * math.pow(second, 2), 0)
+        step = np.minimum(distanceToNextCar, step)
+        return acceleration, newSpeed, step
+
+    @staticmethod
+    def ratioCoeff(safeDistance, distance):
+        """
+        :return: (safeDistance / distance) ^ 2, or sys.maxint where the distance is not positive
+        """
+        positive = distance > 0
+        ratio = safeDistance / np.where(positive, distance, 1)
+        return np.where(positive, np.power(ratio, 2), float(sys.maxint))
+
+    def apply(self, cars, speed, step):
+        """
+        Set the new speeds and move the cars forward.
+        """
+        store = cars[0].store
+        store.speed[[car.row for car in cars]] = speed
+        for car, carSpeed, carStep in zip(cars, speed.tolist(), step.tolist()):
+            car.trajectory.setSpeed(carSpeed)
+            car.finishMove(carStep)
+
+    def scalarSteps(self, cars, second):
+        """
+        Compute the step of the given cars one by one with Engine, without changing their state.
+        :return: (acceleration, speed, step) arrays in the order of the cars
+        """
+        acceleration, speed, step = [], [], []
+        for car in cars:
+            carAcceleration = car.engine.getAcceleration()
+            carSpeed = car.engine.limitSpeed(car.engine.speed + carAcceleration * second * Traffic.SECOND_PER_HOUR)
+            carStep = max(carSpeed * second / Traffic.SECOND_PER_HOUR + 0.5 * carAcceleration * math.pow(second, 2), 0)
+            _, nextCarDist = car.trajectory.nextCarDistance()
+            acceleration.append(carAcceleration)
+            speed.append(carSpeed)
+            step.append(min(max(nextCarDist, 0), carStep))
+        return np.array(acceleration), np.array(speed), np.array(step)
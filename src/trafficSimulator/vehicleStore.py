@@ -0,0 +1,175 @@
+import numpy as np
+
+
+class VehicleStore(object):
+    """
+    The state of all vehicles in contiguous NumPy arrays (struct of arrays). Each vehicle owns one
+    row. Car, Engine and LanePosition keep the row and read and write their state here, so the state
+    of all vehicles can be computed in bulk. The rows of the deleted vehicles are recycled through
+    a free list.
+
+    A vehicle has two LanePositions: the current one (slot CURRENT) and the one on the next lane
+    while it is crossing an intersection (slot NEXT), so position and laneIdx have two columns.
+    Lanes and roads are referred to by their index in self.lanes and self.roads.
+    """
+
+    CURRENT = 0
+    NEXT = 1
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.capacity = 0
+        self.size = 0         # the number of rows that have been used; rows >= size are never used
+        self.freeRows = []    # the released rows below size
+        self.lanes = []       # lane index -> Lane
+        self.roads = []       # road index -> Road
+        self.laneRoads = []   # lane index -> road index
+
+        self.position = np.zeros((0, 2), dtype=np.float64)  # absolute position (km) on the lane of each slot
+        self.laneIdx = np.zeros((0, 2), dtype=np.int32)     # the lane of each slot; -1: no lane
+        self.roadIdx = np.zeros(0, dtype=np.int32)          # the road of the current lane; -1: no road
+        self.nextLaneIdx = np.zeros(0, dtype=np.int32)      # the lane after the next intersection; -1: not picked
+        self.speed = np.zeros(0, dtype=np.float64)          # km/h
+        self.maxSpeed = np.zeros(0, dtype=np.float64)       # km/h
+        self.length = np.zeros(0, dtype=np.float64)         # km
+        self.alive = np.zeros(0, dtype=bool)
+        self.delete = np.zeros(0, dtype=bool)
+        self.crashed = np.zeros(0, dtype=bool)
+        self.isTaxi = np.zeros(0, dtype=bool)
+        self.used = np.zeros(0, dtype=bool)                 # the row belongs to a vehicle
+        self.grow(capacity)
+
+    def grow(self, capacity):
+        """
+        Enlarge the arrays to the given number of rows.
+        """
+        if capacity <= self.capacity:
+            return
+        extra = capacity - self.capacity
+
+        def extend(arr, fill):
+            return np.concatenate((arr, np.full((extra,) + arr.shape[1:], fill, dtype=arr.dtype)))
+
+        self.position = extend(self.position, 0)
+        self.laneIdx = extend(self.laneIdx, -1)
+        self.roadIdx = extend(self.roadIdx, -1)
+        self.nextLaneIdx = extend(self.nextLaneIdx, -1)
+        self.speed = extend(self.speed, 0)
+        self.maxSpeed = extend(self.maxSpeed, 0)
+        self.length = extend(self.length, 0)
+        self.alive = extend(self.alive, False)
+        self.delete = extend(self.delete, False)
+        self.crashed = extend(self.crashed, False)
+        self.isTaxi = extend(self.isTaxi, False)
+        self.used = extend(self.used, False)
+        self.capacity = capacity
+
+    def allocate(self):
+        """
+        Get a row for a new vehicle. The released rows are reused first.
+        :return: (int) row
+        """
+        if self.freeRows:
+            row = self.freeRows.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow(max(2 * self.capacity, VehicleStore.INITIAL_CAPACITY))
+            row = self.size
+            self.size += 1
+        self.used[row] = True
+        return row
+
+    @classmethod
+    def checkRow(cls, row):
+        """
+        :return: the row; raise ValueError if it is None (the vehicle has given its row back), since
+                 None would index the whole column instead of failing
+        """
+        if row is None:
+            raise ValueError("The vehicle's row in the VehicleStore has been released")
+        return row
+
+    def release(self, row):
+        """
+        Give the row back to the free list and clear it.
+        """
+        if not self.used[VehicleStore.checkRow(row)]:
+            return
+        self.used[row] = False
+        self.position[row] = 0
+        self.laneIdx[row] = -1
+        self.roadIdx[row] = -1
+        self.nextLaneIdx[row] = -1
+        self.speed[row] = 0
+        self.maxSpeed[row] = 0
+        self.length[row] = 0
+        self.alive[row] = False
+        self.delete[row] = False
+        self.crashed[row] = False
+        self.isTaxi[row] = False
+        self.freeRows.append(row)
+
+    def vehicleNum(self):
+        return self.size - len(self.freeRows)
+
+    def activeRows(self):
+        """
+        :return: an array of the rows that belong to vehicles
+        """
+        return np.flatnonzero(self.used[:self.size])
+
+    def laneIndex(self, lane):
+        """
+        :param lane: Lane or None
+        :return: the index of the lane (registered when it is first seen); -1 for None
+        """
+        if lane is None:
+            return -1
+        if lane.storeIdx is None:
+            road = lane.road
+            if road.storeIdx is None:
+                road.storeIdx = len(self.roads)
+                self.roads.append(road)
+            lane.storeIdx = len(self.lanes)
+            self.lanes.append(lane)
+            self.laneRoads.append(road.storeIdx)
+        return lane.storeIdx
+
+    def getLane(self, idx):
+        return self.lanes[idx] if idx >= 0 else None
+
+    def setLane(self, row, slot, lane):
+        """
+        Set the lane of a LanePosition. The road index follows the current lane.
+        """
+        VehicleStore.checkRow(row)
+        idx = self.laneIndex(lane)
+        self.laneIdx[row, slot] = idx
+        if slot == VehicleStore.CURRENT:
+            self.roadIdx[row] = self.laneRoads[idx] if idx >= 0 else -1
+
+
+def rowProperty(column, doc=None):
+    """
+    A property of a proxy object (with store and row attributes) that reads and writes a column of the store.
+    :param column: the name of the column in VehicleStore
+    """
+    # item() and itemset() are faster than indexing, and item() gives a Python scalar
+    def getter(self):
+        return getattr(self.store, column).item(VehicleStore.checkRow(self.row))
+
+    def setter(self, value):
+        getattr(self.store, column).itemset(VehicleStore.checkRow(self.row), value)
+    return property(getter, setter, doc=doc)
+
+
+def slotProperty(column, doc=None):
+    """
+    Like rowProperty, for the columns that have a value for each slot (with store, row and slot attributes).
+    """
+    def getter(self):
+        return getattr(self.store, column).item(VehicleStore.checkRow(self.row), self.slot)
+
+    def setter(self, value):
+        getattr(self.store, column).itemset(VehicleStore.checkRow(self.row), self.slot, value)
+    return property(getter, setter, doc=doc)